@@ -0,0 +1,216 @@
+# Group-average attention maps for the fixation heatmaps.
+# Each heatmap is decoded once; in the same pass its overall and regional sparsity
+# and its fused heatmap statistics (heatmap_metrics.py) are computed, and its
+# attention intensity (255 - grayscale value, 0 on the white background) is added
+# to running per-pixel sums of the group. Only the running sums are kept, so the
+# mean, variance and expert-minus-novice difference maps are produced without ever
+# holding all images in memory. Workers build partial accumulators over chunks of
+# heatmaps, which are then merged.
+
+import os
+import functools
+import numpy as np
+from PIL import Image
+from scipy import stats
+from concurrent.futures import ProcessPoolExecutor
+from sparsity import mask_sparsity_and_regions, scan_heatmaps, EXPERT_DIR, NOVICE_DIR, GRID_SIZES
+from heatmap_metrics import fused_statistics, metrics_dtype, DEFAULT_METRICS
+
+CHUNKS_PER_WORKER = 4  # heatmap chunks handed to each worker
+
+
+class AttentionAccumulator:
+    '''
+    Running per-pixel sums of attention intensity for one group.
+    count:  number of heatmaps added
+    total:  uint32 sum of intensities (overflows only after ~16.8 million maps)
+    sum_sq: uint64 sum of squared intensities (a uint32 would overflow after ~66k maps)
+    '''
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.count = 0
+        self.total = np.zeros(self.shape, dtype=np.uint32)
+        self.sum_sq = np.zeros(self.shape, dtype=np.uint64)
+        self._square = np.empty(self.shape, dtype=np.uint32)
+
+    def add(self, intensity):
+        '''Add one (H, W) uint8 attention intensity map.'''
+        if intensity.shape != self.shape:
+            raise ValueError(f"Heatmap shape {intensity.shape} does not match accumulator shape {self.shape}")
+        np.add(self.total, intensity, out=self.total)
+        np.multiply(intensity, intensity, out=self._square, dtype=np.uint32)
+        np.add(self.sum_sq, self._square, out=self.sum_sq)
+        self.count += 1
+
+    def merge(self, other):
+        '''Add the sums of another accumulator (e.g. from another worker) into this one.'''
+        if other.shape != self.shape:
+            raise ValueError(f"Cannot merge accumulators of shape {other.shape} and {self.shape}")
+        np.add(self.total, other.total, out=self.total)
+        np.add(self.sum_sq, other.sum_sq, out=self.sum_sq)
+        self.count += other.count
+        return self
+
+    def __getstate__(self):
+        # The squaring scratch buffer is not needed to transfer the sums
+        state = self.__dict__.copy()
+        del state['_square']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._square = np.empty(self.shape, dtype=np.uint32)
+
+    def mean(self):
+        '''
+        Per-pixel mean attention.
+        Formula: mean = S1 / n
+        '''
+        return self.total / self.count
+
+    def variance(self):
+        '''
+        Per-pixel sample variance of attention.
+        Formula: s^2 = (S2 - S1^2 / n) / (n - 1)
+        where S1 = sum of intensities, S2 = sum of squared intensities.
+        Undefined (NaN) with fewer than two heatmaps.
+        '''
+        if self.count < 2:
+            return np.full(self.shape, np.nan)
+        s1 = self.total.astype(np.float64)
+        return np.maximum(self.sum_sq - s1 * s1 / self.count, 0) / (self.count - 1)
+
+
+def attention_intensity(gray):
+    '''
+    Attention intensity of a grayscale heatmap: 255 - L, so the white
+    background is 0 and darker (more fixated) pixels are higher.
+    '''
+    return np.subtract(255, gray, dtype=np.uint8)
+
+
+def accumulate_chunk(paths, grid_sizes=GRID_SIZES, metrics=DEFAULT_METRICS):
+    '''
+    Decode each heatmap of a chunk once, computing its overall and regional
+    sparsity (the grayscale < 255 mask, as calculate_sparsity) and its fused
+    statistics, and adding its attention intensity to a fresh accumulator.
+    Returns (sparsity list, regions list, statistics list,
+             AttentionAccumulator or None for an empty chunk).
+    '''
+    sparsity, regions, statistics = [], [], []
+    accumulator = None
+    for path in paths:
+        with Image.open(path) as img:
+            gray = np.asarray(img.convert('L'))
+        value, grid = mask_sparsity_and_regions(gray < 255, grid_sizes)
+        sparsity.append(value)
+        regions.append(grid)
+        statistics.append(fused_statistics(gray, metrics))
+        if accumulator is None:
+            accumulator = AttentionAccumulator(gray.shape)
+        accumulator.add(attention_intensity(gray))
+    return sparsity, regions, statistics, accumulator
+
+
+def accumulate_group(paths, workers=None, chunks_per_worker=CHUNKS_PER_WORKER,
+                     grid_sizes=GRID_SIZES, metrics=DEFAULT_METRICS):
+    '''
+    Sparsity, regional sparsity, fused statistics and merged attention
+    accumulator for one group of heatmaps, decoding each heatmap once.
+    Paths are split into contiguous chunks; each chunk is reduced by one worker
+    and the per-chunk results are merged in chunk order.
+    Returns (sparsity (N,), regions (N, sum(n^2)), statistics (N,) structured
+    array of metrics_dtype(metrics), AttentionAccumulator), in the order of paths.
+    '''
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No heatmaps to accumulate")
+    reduce = functools.partial(accumulate_chunk, grid_sizes=tuple(grid_sizes), metrics=tuple(metrics))
+    if workers == 1:
+        results = [reduce(paths)]
+    else:
+        n_workers = workers or os.cpu_count() or 1
+        n_chunks = min(len(paths), n_workers * chunks_per_worker)
+        bounds = np.linspace(0, len(paths), n_chunks + 1).astype(int)
+        chunks = [paths[b0:b1] for b0, b1 in zip(bounds[:-1], bounds[1:])]
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            results = list(pool.map(reduce, chunks))
+
+    sparsity, regions, statistics, accumulator = [], [], [], None
+    for chunk_sparsity, chunk_regions, chunk_statistics, chunk_acc in results:
+        sparsity.extend(chunk_sparsity)
+        regions.extend(chunk_regions)
+        statistics.extend(chunk_statistics)
+        accumulator = chunk_acc if accumulator is None else accumulator.merge(chunk_acc)
+    return (np.array(sparsity, dtype=np.float64), np.stack(regions),
+            np.array(statistics, dtype=metrics_dtype(metrics)), accumulator)
+
+
+def difference_map(expert_acc, novice_acc):
+    '''
+    Pixelwise expert-minus-novice difference of mean attention, with Welch's
+    t-test per pixel:
+      t  = (mean_e - mean_n) / sqrt(s_e^2 / n_e + s_n^2 / n_n)
+      df = (s_e^2/n_e + s_n^2/n_n)^2 / ((s_e^2/n_e)^2/(n_e-1) + (s_n^2/n_n)^2/(n_n-1))
+      p  = 2 * P(T_df > |t|)
+    Pixels with zero variance in both groups have t = p = NaN.
+    One test per pixel, so q holds the p-values adjusted for the false discovery
+    rate (Benjamini-Hochberg) over all tested (non-NaN) pixels.
+    Returns a dict of (H, W) maps: difference, t, p, q.
+    '''
+    se_e = expert_acc.variance() / expert_acc.count
+    se_n = novice_acc.variance() / novice_acc.count
+    se = se_e + se_n
+    difference = expert_acc.mean() - novice_acc.mean()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = difference / np.sqrt(se)
+        df = se ** 2 / (se_e ** 2 / (expert_acc.count - 1) + se_n ** 2 / (novice_acc.count - 1))
+    t[se == 0] = np.nan
+    p = 2 * stats.t.sf(np.abs(t), df)
+    tested = ~np.isnan(p)
+    q = np.full_like(p, np.nan)
+    if tested.any():
+        q[tested] = stats.false_discovery_control(p[tested])
+    return {'difference': difference, 't': t, 'p': p, 'q': q}
+
+
+def plot_group_maps(expert_acc, novice_acc, diff, alpha, path):
+    '''
+    Save the group mean attention maps and the expert-minus-novice difference
+    map, masked to pixels with FDR-adjusted q < alpha, side by side.
+    '''
+    import matplotlib.pyplot as plt
+    significant = diff['q'] < alpha
+    fig, axes = plt.subplots(1, 3, figsize=(18, 4))
+    axes[0].imshow(expert_acc.mean(), cmap='hot_r')
+    axes[0].set_title('Mean attention - Experts')
+    axes[1].imshow(novice_acc.mean(), cmap='hot_r')
+    axes[1].set_title('Mean attention - Novices')
+    limit = np.abs(diff['difference']).max() or 1
+    im = axes[2].imshow(np.where(significant, diff['difference'], 0), cmap='bwr', vmin=-limit, vmax=limit)
+    axes[2].set_title(f'Experts - Novices (FDR-adjusted q < {alpha})')
+    for ax in axes:
+        ax.axis('off')
+    fig.colorbar(im, ax=axes[2], label='Attention difference (intensity)')
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    plt.show()
+
+
+if __name__ == "__main__":
+    from question2 import ALPHA
+
+    expert_sparsity, _, _, expert_acc = accumulate_group(scan_heatmaps(EXPERT_DIR))
+    novice_sparsity, _, _, novice_acc = accumulate_group(scan_heatmaps(NOVICE_DIR))
+    diff = difference_map(expert_acc, novice_acc)
+    significant = diff['q'] < ALPHA
+    print(f"Experts: {expert_acc.count} heatmaps, mean sparsity = {expert_sparsity.mean():.4f}")
+    print(f"Novices: {novice_acc.count} heatmaps, mean sparsity = {novice_sparsity.mean():.4f}")
+    print(f"Pixels with significant expert-novice attention difference (Benjamini-Hochberg FDR q < {ALPHA}): "
+          f"{np.count_nonzero(significant)} ({np.mean(significant) * 100:.2f}%)")
+
+    # Group mean attention maps and the masked difference map
+    os.makedirs('figures', exist_ok=True)
+    plot_group_maps(expert_acc, novice_acc, diff, ALPHA, 'figures/attention_q4_group_maps.png')
+    print("Saved: figures/attention_q4_group_maps.png")
@@ -0,0 +1,160 @@
+# Fixation sparsity from raw eye-tracker fixation logs.
+# Instead of rendering heatmap PNGs, fixation records (x, y, duration, radius) are
+# streamed in chunks and stamped as discs into an in-memory mask of the screen,
+# from which the same N_nonwhite / (W * H) sparsity is computed.
+# Supported inputs:
+#   - CSV with columns x, y, duration, radius (pixels, pixels, seconds, pixels)
+#   - binary file of little-endian float32 records with the same four fields (LOG_DTYPE)
+
+import os
+import numpy as np
+import pandas as pd
+
+SCREEN_WIDTH = 1920
+SCREEN_HEIGHT = 1080
+CHUNK_ROWS = 100_000  # fixation records read per chunk
+STAMP_BUDGET = 1 << 22  # max pixel indices generated per stamping step
+LOG_COLUMNS = ['x', 'y', 'duration', 'radius']
+LOG_DTYPE = np.dtype([(name, '<f4') for name in LOG_COLUMNS])
+LOG_EXTENSIONS = ('.csv', '.bin')
+EXPERT_LOG_DIR = "fixation_logs/experts"
+NOVICE_LOG_DIR = "fixation_logs/novice"
+
+
+def disc_offsets(radius, width):
+    '''
+    Flat index offsets of all pixels within a disc of the given radius,
+    for a row-major image of the given width: offset = dy * W + dx
+    with dx^2 + dy^2 <= r^2. Also returns dx, dy for bounds checks.
+    '''
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inside = dx ** 2 + dy ** 2 <= radius ** 2
+    dx, dy = dx[inside], dy[inside]
+    return dy * width + dx, dx, dy
+
+
+class FixationRaster:
+    '''
+    Screen-sized raster of fixated pixels built from fixation records.
+    mask:  flat boolean array of pixels covered by at least one fixation disc
+           (one byte per pixel, 2 MB at 1920 x 1080, so stamping is a plain
+           fancy-index assignment and counting a single count_nonzero)
+    dwell: flat float64 array of summed fixation duration per pixel (weighted=True)
+    '''
+
+    def __init__(self, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, weighted=False):
+        self.width = width
+        self.height = height
+        self.mask = np.zeros(width * height, dtype=bool)
+        self.dwell = np.zeros(width * height, dtype=np.float64) if weighted else None
+        self._offsets = {}
+
+    def _disc(self, radius):
+        if radius not in self._offsets:
+            self._offsets[radius] = disc_offsets(radius, self.width)
+        return self._offsets[radius]
+
+    def add(self, x, y, duration, radius):
+        '''
+        Stamp a chunk of fixations. Fixations are grouped by rounded radius so
+        each group is stamped with one broadcast (fixation x disc-offset) index
+        array; pixels falling outside the screen are dropped.
+        '''
+        cx = np.rint(x).astype(np.int64)
+        cy = np.rint(y).astype(np.int64)
+        radii = np.maximum(np.rint(radius).astype(np.int64), 0)
+        duration = np.asarray(duration, dtype=np.float64)
+
+        for r in np.unique(radii):
+            group = np.flatnonzero(radii == r)
+            offsets, dx, dy = self._disc(int(r))
+            step = max(1, STAMP_BUDGET // len(offsets))
+            for start in range(0, len(group), step):
+                sel = group[start:start + step]
+                px = cx[sel, None] + dx[None, :]
+                py = cy[sel, None] + dy[None, :]
+                on_screen = (px >= 0) & (px < self.width) & (py >= 0) & (py < self.height)
+                idx = (cy[sel, None] * self.width + cx[sel, None] + offsets[None, :])[on_screen]
+                self.mask[idx] = True
+                if self.dwell is not None:
+                    # Sum the dwell of overlapping discs with one bincount over the
+                    # touched index range only, not over the whole screen
+                    weights = np.broadcast_to(duration[sel, None], on_screen.shape)[on_screen]
+                    if len(idx):
+                        lo, hi = idx.min(), idx.max() + 1
+                        self.dwell[lo:hi] += np.bincount(idx - lo, weights=weights, minlength=hi - lo)
+
+    def sparsity(self):
+        '''
+        Fixation sparsity of the raster.
+        Formula: Sparsity = N_fixated / (W * H)
+        '''
+        return np.count_nonzero(self.mask) / self.mask.size
+
+    def weighted_sparsity(self):
+        '''
+        Duration-weighted sparsity: the effective fixated area of the dwell-time
+        distribution, as a fraction of the screen.
+        Formula: p_i = dwell_i / sum(dwell)
+                 E = -sum(p_i * ln(p_i))         (dwell entropy, nats)
+                 Weighted sparsity = exp(E) / (W * H)
+        Equals the plain sparsity when dwell time is spread evenly over the
+        fixated pixels, and is lower when dwell concentrates on a few of them.
+        '''
+        if self.dwell is None:
+            raise ValueError("Raster was built without duration weighting (weighted=False)")
+        total = self.dwell.sum()
+        if total <= 0:
+            return 0.0
+        p = self.dwell[self.dwell > 0] / total
+        return np.exp(-np.sum(p * np.log(p))) / self.mask.size
+
+
+def read_fixations(path, chunk_rows=CHUNK_ROWS):
+    '''
+    Stream a fixation log in chunks of chunk_rows records.
+    Yields (x, y, duration, radius) numpy arrays per chunk.
+    CSV files are read with pandas; .bin files are memory-mapped as LOG_DTYPE records.
+    '''
+    if path.endswith('.csv'):
+        for chunk in pd.read_csv(path, usecols=LOG_COLUMNS, chunksize=chunk_rows):
+            yield tuple(chunk[name].to_numpy() for name in LOG_COLUMNS)
+    else:
+        records = np.memmap(path, dtype=LOG_DTYPE, mode='r')
+        for start in range(0, len(records), chunk_rows):
+            chunk = records[start:start + chunk_rows]
+            yield tuple(np.asarray(chunk[name]) for name in LOG_COLUMNS)
+
+
+def log_sparsity(path, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, weighted=False, chunk_rows=CHUNK_ROWS):
+    '''
+    Fixation sparsity of one fixation log, without writing any image.
+    Returns a dict with 'sparsity' and, if weighted, 'weighted_sparsity'.
+    '''
+    raster = FixationRaster(width, height, weighted=weighted)
+    for x, y, duration, radius in read_fixations(path, chunk_rows):
+        raster.add(x, y, duration, radius)
+    result = {'sparsity': raster.sparsity()}
+    if weighted:
+        result['weighted_sparsity'] = raster.weighted_sparsity()
+    return result
+
+
+def scan_logs(directory):
+    '''
+    List the fixation logs (.csv / .bin) in a directory, sorted by filename.
+    '''
+    with os.scandir(directory) as entries:
+        names = sorted(entry.name for entry in entries
+                       if entry.is_file() and entry.name.endswith(LOG_EXTENSIONS))
+    return [os.path.join(directory, name) for name in names]
+
+
+def load_group_log_sparsity(expert_dir, novice_dir, weighted=False, width=SCREEN_WIDTH, height=SCREEN_HEIGHT):
+    '''
+    Sparsity of every fixation log in the expert and novice directories.
+    Returns (expert_results, novice_results): lists of log_sparsity dicts
+    in sorted filename order.
+    '''
+    return ([log_sparsity(path, width, height, weighted) for path in scan_logs(expert_dir)],
+            [log_sparsity(path, width, height, weighted) for path in scan_logs(novice_dir)])
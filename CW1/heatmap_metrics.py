@@ -0,0 +1,131 @@
+# Fused heatmap statistics for the fixation heatmaps.
+# Computes a configurable set of per-heatmap gaze statistics from a single decode
+# and a single chunked pass over the pixels. Each pixel is weighted by its
+# attention intensity w = 255 - L (0 on the white background), and every metric
+# is derived from the same few reductions accumulated per block of rows:
+#   - intensity histogram        -> sparsity, total weight, entropy
+#   - weighted first/second moments of x, y -> centroid, spatial dispersion
+# Results come back as one structured array, so adding metrics adds no extra I/O.
+
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from sparsity import CHUNK_SIZE, ROW_CHUNK
+
+# Metric name -> structured array fields it produces
+METRIC_FIELDS = {
+    'sparsity': ['sparsity'],
+    'entropy': ['entropy'],
+    'centroid': ['centroid_x', 'centroid_y'],
+    'dispersion': ['var_x', 'var_y', 'cov_xy', 'dispersion'],
+}
+DEFAULT_METRICS = ('sparsity', 'entropy', 'centroid', 'dispersion')
+
+# w * ln(w) for every intensity value (0 * ln 0 = 0)
+_LEVELS = np.arange(256, dtype=np.float64)
+_W_LOG_W = np.zeros(256)
+_W_LOG_W[1:] = _LEVELS[1:] * np.log(_LEVELS[1:])
+
+
+def metrics_dtype(metrics=DEFAULT_METRICS):
+    '''Structured dtype holding the fields of the requested metrics.'''
+    unknown = [m for m in metrics if m not in METRIC_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown heatmap metrics: {unknown}")
+    return np.dtype([(field, np.float64) for m in metrics for field in METRIC_FIELDS[m]])
+
+
+def fused_statistics(gray, metrics=DEFAULT_METRICS, row_chunk=ROW_CHUNK):
+    '''
+    Compute the requested statistics of one (H, W) grayscale heatmap in one pass.
+    With w = 255 - L, p = w / sum(w), and pixel coordinates (x, y):
+      Sparsity   = N(w > 0) / (W * H)
+      Entropy    = -sum(p * ln p) = ln(S0) - sum(w * ln w) / S0     (nats)
+      Centroid   = (sum(w x) / S0, sum(w y) / S0)
+      Dispersion = var_x = sum(w x^2) / S0 - cx^2, var_y likewise,
+                   cov_xy = sum(w x y) / S0 - cx * cy,
+                   dispersion = sqrt(var_x + var_y)   (radius of gyration, pixels)
+    where S0 = sum(w). Per block of rows, one intensity histogram gives N, S0
+    and sum(w ln w); column and row sums of w give the x and y moments, and one
+    matrix-vector product gives the cross moment.
+    Returns a structured scalar of metrics_dtype(metrics). Metrics that need
+    weights are NaN for a completely white heatmap.
+    '''
+    dtype = metrics_dtype(metrics)
+    height, width = gray.shape
+    need_hist = 'sparsity' in metrics or 'entropy' in metrics
+    need_moments = 'centroid' in metrics or 'dispersion' in metrics
+
+    xs = np.arange(width, dtype=np.float64)
+    histogram = np.zeros(256, dtype=np.int64)
+    col_w = np.zeros(width, dtype=np.float64)  # sum of w over rows, per column
+    s_y = s_yy = s_xy = 0.0
+    w = np.empty((min(row_chunk, height), width), dtype=np.uint8)
+
+    for r0 in range(0, height, w.shape[0]):
+        block = w[:min(w.shape[0], height - r0)]
+        np.subtract(255, gray[r0:r0 + block.shape[0]], out=block)
+        if need_hist:
+            histogram += np.bincount(block.ravel(), minlength=256)
+        if need_moments:
+            ys = np.arange(r0, r0 + block.shape[0], dtype=np.float64)
+            row_w = block.sum(axis=1, dtype=np.float64)
+            col_w += block.sum(axis=0, dtype=np.float64)
+            s_y += row_w @ ys
+            s_yy += row_w @ (ys * ys)
+            s_xy += ys @ (block @ xs)
+
+    out = np.zeros((), dtype=dtype)
+    if need_hist:
+        s0 = histogram @ _LEVELS
+        if 'sparsity' in metrics:
+            out['sparsity'] = histogram[1:].sum() / (width * height)
+        if 'entropy' in metrics:
+            out['entropy'] = np.log(s0) - (histogram @ _W_LOG_W) / s0 if s0 > 0 else np.nan
+    if need_moments:
+        s0 = col_w.sum()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cx = (col_w @ xs) / s0
+            cy = s_y / s0
+            var_x = (col_w @ (xs * xs)) / s0 - cx * cx
+            var_y = s_yy / s0 - cy * cy
+            cov_xy = s_xy / s0 - cx * cy
+        if 'centroid' in metrics:
+            out['centroid_x'], out['centroid_y'] = cx, cy
+        if 'dispersion' in metrics:
+            out['var_x'], out['var_y'], out['cov_xy'] = var_x, var_y, cov_xy
+            out['dispersion'] = np.sqrt(max(var_x + var_y, 0.0)) if s0 > 0 else np.nan
+    return out
+
+
+def heatmap_statistics(image_path, metrics=DEFAULT_METRICS):
+    '''
+    Decode one heatmap (once) and compute its fused statistics.
+    '''
+    with Image.open(image_path) as img:
+        gray = np.asarray(img.convert('L'))
+    return fused_statistics(gray, metrics)
+
+
+def _statistics_for(args):
+    path, metrics = args
+    return heatmap_statistics(path, metrics)
+
+
+def compute_heatmap_statistics(paths, metrics=DEFAULT_METRICS, workers=None, chunk_size=CHUNK_SIZE):
+    '''
+    Fused statistics of every heatmap in paths, on the process pool.
+    Returns a structured array of length len(paths), in the order of paths.
+    '''
+    paths = list(paths)
+    metrics = tuple(metrics)
+    out = np.empty(len(paths), dtype=metrics_dtype(metrics))
+    if workers == 1 or len(paths) <= chunk_size:
+        for i, path in enumerate(paths):
+            out[i] = heatmap_statistics(path, metrics)
+        return out
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i, stats in enumerate(pool.map(_statistics_for, ((p, metrics) for p in paths),
+                                           chunksize=chunk_size)):
+            out[i] = stats
+    return out
@@ -0,0 +1,169 @@
+# Packed fixation-mask store for repeated gaze analyses.
+# Sparsity only depends on which pixels are fixated, so each heatmap is reduced
+# once to a binary mask, bit-packed with np.packbits (W * H / 8 bytes, ~260 KB for
+# 1920 x 1080) and written as one row of a memory-mapped .npy file. A small .npz
+# index records the filename, participant and group of every row.
+# Sparsity then comes from popcounts, and pairwise overlap (Jaccard / Dice)
+# between participants' masks is computed on the packed bits, without decoding
+# any PNG.
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sparsity import nonwhite_mask, scan_heatmaps, CHUNK_SIZE, EXPERT_DIR, NOVICE_DIR
+
+STORE_DIR = "fixation_maps/mask_store"
+MASKS_FILE = "masks.npy"
+INDEX_FILE = "index.npz"
+BLOCK_BYTES = 1 << 26  # max size of the temporary AND-ed bit block in overlap()
+
+
+def packed_mask(image_path):
+    '''
+    Bit-packed non-white mask of one heatmap, flattened in row-major order.
+    Returns (packed_bytes, (H, W)).
+    '''
+    mask = nonwhite_mask(image_path)
+    return np.packbits(mask, axis=None), mask.shape
+
+
+def build_mask_store(store_dir=STORE_DIR, groups=None, workers=None, chunk_size=CHUNK_SIZE):
+    '''
+    Convert the heatmaps of each group into one packed mask store.
+    groups: dict group name -> heatmap directory (default: experts and novices).
+    Rows are written in group order, then sorted filename order.
+    All heatmaps must share one resolution.
+    Returns the opened MaskStore.
+    '''
+    if groups is None:
+        groups = {'experts': EXPERT_DIR, 'novices': NOVICE_DIR}
+
+    paths, names, labels = [], [], []
+    for group, directory in groups.items():
+        for path in scan_heatmaps(directory):
+            paths.append(path)
+            names.append(os.path.basename(path))
+            labels.append(group)
+    if not paths:
+        raise ValueError("No heatmaps found to build the mask store from")
+
+    os.makedirs(store_dir, exist_ok=True)
+    masks = None
+    shape = None
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for row, (packed, mask_shape) in enumerate(pool.map(packed_mask, paths, chunksize=chunk_size)):
+            if masks is None:
+                shape = mask_shape
+                masks = np.lib.format.open_memmap(os.path.join(store_dir, MASKS_FILE), mode='w+',
+                                                  dtype=np.uint8, shape=(len(paths), packed.size))
+            elif mask_shape != shape:
+                raise ValueError(f"{paths[row]} is {mask_shape[1]}x{mask_shape[0]}, "
+                                 f"expected {shape[1]}x{shape[0]}")
+            masks[row] = packed
+    masks.flush()
+    del masks
+
+    np.savez(os.path.join(store_dir, INDEX_FILE),
+             names=np.array(names),
+             participants=np.array([os.path.splitext(name)[0] for name in names]),
+             groups=np.array(labels),
+             shape=np.array(shape))
+    return MaskStore(store_dir)
+
+
+class MaskStore:
+    '''
+    Read-only view of a packed mask store.
+    masks: (N, ceil(H * W / 8)) uint8 memmap, one bit-packed mask per row.
+    names / participants / groups: per-row index arrays.
+    '''
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.masks = np.load(os.path.join(store_dir, MASKS_FILE), mmap_mode='r')
+        with np.load(os.path.join(store_dir, INDEX_FILE)) as index:
+            self.names = index['names']
+            self.participants = index['participants']
+            self.groups = index['groups']
+            self.shape = tuple(int(n) for n in index['shape'])
+
+    def __len__(self):
+        return self.masks.shape[0]
+
+    def rows(self, group=None):
+        '''Row indices of one group (all rows if group is None).'''
+        if group is None:
+            return np.arange(len(self))
+        return np.flatnonzero(self.groups == group)
+
+    def _block_rows(self, n_rows):
+        return max(1, BLOCK_BYTES // self.masks.shape[1] // max(n_rows, 1))
+
+    def popcounts(self, rows=None):
+        '''
+        Number of fixated (set) pixels in each mask, from byte-wise popcounts.
+        Rows are read in blocks so only a slice of the store is paged in at once.
+        '''
+        rows = self.rows() if rows is None else np.asarray(rows)
+        counts = np.empty(len(rows), dtype=np.int64)
+        step = self._block_rows(1)
+        for start in range(0, len(rows), step):
+            block = self.masks[rows[start:start + step]]
+            counts[start:start + step] = np.bitwise_count(block).sum(axis=1, dtype=np.int64)
+        return counts
+
+    def sparsity(self, group=None):
+        '''
+        Fixation sparsity of every mask in a group.
+        Formula: Sparsity = popcount(mask) / (W * H)
+        '''
+        return self.popcounts(self.rows(group)) / (self.shape[0] * self.shape[1])
+
+    def intersections(self, rows_a, rows_b):
+        '''
+        Pairwise |A_i AND B_j| for two sets of rows, computed block-wise on the
+        packed bits. Returns an (len(rows_a), len(rows_b)) int64 matrix.
+        '''
+        rows_a = np.asarray(rows_a)
+        rows_b = np.asarray(rows_b)
+        result = np.empty((len(rows_a), len(rows_b)), dtype=np.int64)
+        step_b = min(len(rows_b), self._block_rows(1)) or 1
+        step_a = self._block_rows(step_b)
+        for b0 in range(0, len(rows_b), step_b):
+            block_b = self.masks[rows_b[b0:b0 + step_b]]
+            for a0 in range(0, len(rows_a), step_a):
+                block_a = self.masks[rows_a[a0:a0 + step_a]]
+                both = np.bitwise_and(block_a[:, None, :], block_b[None, :, :])
+                result[a0:a0 + step_a, b0:b0 + step_b] = np.bitwise_count(both).sum(axis=2, dtype=np.int64)
+        return result
+
+    def overlap(self, rows_a=None, rows_b=None, metric='jaccard'):
+        '''
+        Pairwise overlap between fixation masks.
+          Jaccard: |A & B| / |A | B| = |A & B| / (|A| + |B| - |A & B|)
+          Dice:    2 |A & B| / (|A| + |B|)
+        Pairs of two empty masks are given an overlap of 0.
+        '''
+        rows_a = self.rows() if rows_a is None else np.asarray(rows_a)
+        rows_b = rows_a if rows_b is None else np.asarray(rows_b)
+        inter = self.intersections(rows_a, rows_b)
+        size_sum = self.popcounts(rows_a)[:, None] + self.popcounts(rows_b)[None, :]
+        if metric == 'jaccard':
+            numer, denom = inter, size_sum - inter
+        elif metric == 'dice':
+            numer, denom = 2 * inter, size_sum
+        else:
+            raise ValueError(f"Unknown overlap metric: {metric}")
+        return np.divide(numer, denom, out=np.zeros(inter.shape), where=denom > 0)
+
+
+if __name__ == "__main__":
+    # One-off conversion of the heatmap PNGs into the packed mask store
+    store = build_mask_store()
+    print(f"Packed {len(store)} masks ({store.shape[1]}x{store.shape[0]}, "
+          f"{store.masks.shape[1] / 1024:.0f} KB each) into {STORE_DIR}")
+    for group in ('experts', 'novices'):
+        rows = store.rows(group)
+        jaccard = store.overlap(rows)
+        pairs = jaccard[np.triu_indices(len(rows), k=1)]
+        print(f"{group.capitalize()}: mean sparsity = {store.sparsity(group).mean():.4f}, "
+              f"mean pairwise Jaccard = {pairs.mean():.4f}")
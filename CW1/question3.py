@@ -4,6 +4,7 @@ import pandas as pd
 from scipy import stats
 from question1 import calculate_mean, calculate_median, calculate_variance, calculate_stddev, skewness, kurtosis
 from question2 import calculate_descriptive_stats, cohens_d, interpret_cohens_d, ALPHA
+from transitions import compare_groups, print_transition_matrix
 
 # QUESTION 3
 
@@ -210,6 +211,22 @@ print(f"{'Error Metric':<20} {exp_str:<22} {nov_str:<22} {res['u_stat']:>6.1f} {
 print("-" * 120)
 print("Mdn = Median, IQR = Interquartile Range (Q1-Q3)")
 
+# Gesture transition analysis
+# The error count ignores gesture order, so each sequence is also modelled as a
+# first-order Markov chain and the expert/novice transition matrices are compared
+# with a permutation test (see transitions.py).
+
+transition_results = compare_groups(expert_sequences.values(), novice_sequences.values())
+
+print("\nGesture Transition Matrices P(next | current)")
+print_transition_matrix(transition_results['expert_transitions'], "Experts:")
+print_transition_matrix(transition_results['novice_transitions'], "Novices:")
+
+trans_test = transition_results['test']
+trans_sig = "Yes" if trans_test['p_value'] < ALPHA else "No"
+print(f"Permutation test ({trans_test['n_permutations']} permutations): "
+      f"L1 distance={trans_test['statistic']:.4f}, p={trans_test['p_value']:.4f}, Significant? {trans_sig}")
+
 # Generate box plot for error metric
 import matplotlib.pyplot as plt
 import os
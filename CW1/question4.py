@@ -1,137 +1,218 @@
 import numpy as np
-from PIL import Image
 import os
 from scipy import stats
-from question1 import calculate_mean, calculate_median, calculate_variance, calculate_stddev, skewness, kurtosis
-from question2 import calculate_descriptive_stats, cohens_d, interpret_cohens_d, ALPHA
+from sparsity import EXPERT_DIR, NOVICE_DIR, GRID_SIZES, split_grids
+from sparsity_index import SparsityIndex
+from attention_maps import difference_map, plot_group_maps
+from fixation_logs import load_group_log_sparsity, EXPERT_LOG_DIR, NOVICE_LOG_DIR
 
 
-def calculate_sparsity(image_path):
+def select_test(experts, novices, alpha):
     '''
-    Calculates the fixation sparsity for a single heatmap image.
-    Formula: Sparsity = N_nonwhite / (W * H)
-    where W = 1920, H = 1080 (image resolution), total = 2,073,600 pixels.
-    Non-white pixels (value < 255) indicate locations where fixations were recorded.
-    Higher sparsity = more dispersed gaze; lower sparsity = more focused attention.
+    Data-driven test selection decision tree:
+      Step 1: Shapiro-Wilk -> both groups normal?
+        Yes -> Step 2: Levene's test -> equal variances?
+          Yes -> Independent t-test (most powerful parametric test)
+          No  -> Welch's t-test (does not assume equal variances)
+        No  -> Mann-Whitney U (non-parametric, no normality assumption)
+    See question2.py for full hypothesis definitions of each test.
+    Returns a dict with the Shapiro-Wilk and Levene results, the selected
+    test name, its statistic and p-value.
     '''
-    img = Image.open(image_path).convert('L') # Grayscale conversion
-    pixels = np.array(img)
-    total_pixels = 1920 * 1080
-    non_white_count = np.sum(pixels < 255) # Counts non-white pixels
-    sparsity = non_white_count / total_pixels
-    return sparsity
-
-expert_dir = "fixation_maps/fixation_maps/experts"
-novice_dir = "fixation_maps/fixation_maps/novice"
-
-expert_sparsity = []
-for filename in os.listdir(expert_dir):
-    if filename.endswith('.png'):
-        path = os.path.join(expert_dir, filename)
-        expert_sparsity.append(calculate_sparsity(path))
-
-novice_sparsity = []
-for filename in os.listdir(novice_dir):
-    if filename.endswith('.png'):
-        path = os.path.join(novice_dir, filename)
-        novice_sparsity.append(calculate_sparsity(path))
-
-data = {
-    'sparsity': {
-    'experts': expert_sparsity,
-    'novices': novice_sparsity
+    exp_w, exp_p = stats.shapiro(experts)
+    nov_w, nov_p = stats.shapiro(novices)
+    lev_stat, lev_p = stats.levene(experts, novices)
+    result = {
+        'exp_w': exp_w, 'exp_p': exp_p, 'exp_normal': exp_p > alpha,
+        'nov_w': nov_w, 'nov_p': nov_p, 'nov_normal': nov_p > alpha,
+        'lev_stat': lev_stat, 'lev_p': lev_p, 'equal_var': lev_p > alpha
     }
-}
-
-# Descriptive Statistics
-print("\nDescriptive Statistics for Fixation Sparsity")
-exp_stats = calculate_descriptive_stats(data['sparsity']['experts'])
-nov_stats = calculate_descriptive_stats(data['sparsity']['novices'])
-print("Experts:", exp_stats)
-print("Novices:", nov_stats)
-
-# Normality Test - Shapiro-Wilk
-print("\nNormality Test - Shapiro-Wilk")
-exp_w, exp_p = stats.shapiro(data['sparsity']['experts'])
-nov_w, nov_p = stats.shapiro(data['sparsity']['novices'])
-
-exp_normal = exp_p > ALPHA
-nov_normal = nov_p > ALPHA
-
-print(f"Experts: w={exp_w:.4f}, p={exp_p:.4f} => {'Normal' if exp_normal else 'Not Normal'}")
-print(f"Novices: w={nov_w:.4f}, p={nov_p:.4f} => {'Normal' if nov_normal else 'Not Normal'}")
-
-# Homogeneity of Variance - Levene's Test
-lev_stat, lev_p = stats.levene(data['sparsity']['experts'], data['sparsity']['novices'])
-equal_var = lev_p > ALPHA
-print(f"\nLevene's Test: statistic={lev_stat:.4f}, p={lev_p:.4f} => {'Equal variance' if equal_var else 'Unequal variance'}")
-
-# Data-driven test selection decision tree:
-#   Step 1: Shapiro-Wilk -> both groups normal?
-#     Yes -> Step 2: Levene's test -> equal variances?
-#       Yes -> Independent t-test (most powerful parametric test)
-#       No  -> Welch's t-test (does not assume equal variances)
-#     No  -> Mann-Whitney U (non-parametric, no normality assumption)
-# See question2.py for full hypothesis definitions of each test.
-print("\nStatistical Test Selection:")
-if exp_normal and nov_normal:
-    if equal_var:
-        # Both normal, equal variances -> Independent t-test
-        test_name = "Independent t-test"
-        t_stat, p_val = stats.ttest_ind(data['sparsity']['experts'], data['sparsity']['novices'])
-        print(f"Both groups normal, equal variances -> {test_name}")
-        print(f"{test_name}: t={t_stat:.4f}, p={p_val:.4f}")
+    if result['exp_normal'] and result['nov_normal']:
+        if result['equal_var']:
+            result['test_name'] = "Independent t-test"
+            statistic, p_val = stats.ttest_ind(experts, novices)
+        else:
+            result['test_name'] = "Welch's t-test"
+            statistic, p_val = stats.ttest_ind(experts, novices, equal_var=False)
     else:
-        # Both normal, unequal variances -> Welch's t-test
-        test_name = "Welch's t-test"
-        t_stat, p_val = stats.ttest_ind(data['sparsity']['experts'], data['sparsity']['novices'], equal_var=False)
-        print(f"Both groups normal, unequal variances -> {test_name}")
-        print(f"{test_name}: t={t_stat:.4f}, p={p_val:.4f}")
-else:
-    # Non-normal -> Mann-Whitney U
-    test_name = "Mann-Whitney U"
-    u_stat, p_val = stats.mannwhitneyu(data['sparsity']['experts'], data['sparsity']['novices'], alternative='two-sided')
-    print(f"Normality violated -> {test_name}")
-    print(f"{test_name}: U={u_stat:.4f}, p={p_val:.4f}")
-
-# Effect Size
-d = cohens_d(data['sparsity']['experts'], data['sparsity']['novices'])
-significant = p_val < ALPHA
-
-print(f"\nCohen's d: {d:.4f} ({interpret_cohens_d(d)})")
-print(f"Significant at alpha={ALPHA}: {'Yes' if significant else 'No'}")
-
-# Final Results Table
-print("\n" + "=" * 100)
-print("FINAL RESULTS TABLE")
-print("=" * 100)
-print(f"{'Metric':<20} {'Expert Median (IQR)':<25} {'Novice Median (IQR)':<25} {'p-value':>10} {'Cohen d':>10} {'Sig?':>6}")
-print("-" * 100)
-
-exp_str = f"{exp_stats['median']:.4f} ({exp_stats['q1']:.4f}-{exp_stats['q3']:.4f})"
-nov_str = f"{nov_stats['median']:.4f} ({nov_stats['q1']:.4f}-{nov_stats['q3']:.4f})"
-sig_str = "Yes" if significant else "No"
-
-print(f"{'Fixation Sparsity':<20} {exp_str:<25} {nov_str:<25} {p_val:>10.4f} {d:>10.4f} {sig_str:>6}")
-print("-" * 100)
-
-# Generate box plot for fixation sparsity
-import matplotlib.pyplot as plt
-os.makedirs('figures', exist_ok=True)
-
-plt.figure(figsize=(8, 5))
-bp = plt.boxplot(
-    [data['sparsity']['experts'], data['sparsity']['novices']],
-    tick_labels=['Experts', 'Novices'],
-    patch_artist=True
-)
-bp['boxes'][0].set_facecolor('blue')
-bp['boxes'][0].set_alpha(0.7)
-bp['boxes'][1].set_facecolor('orange')
-bp['boxes'][1].set_alpha(0.7)
-plt.title('Fixation Sparsity - Experts vs Novices')
-plt.ylabel('Sparsity (ratio)')
-plt.tight_layout()
-plt.savefig('figures/boxplot_q4_fixation_sparsity.png', dpi=150)
-plt.show()
-print("Saved: figures/boxplot_q4_fixation_sparsity.png")
\ No newline at end of file
+        result['test_name'] = "Mann-Whitney U"
+        statistic, p_val = stats.mannwhitneyu(experts, novices, alternative='two-sided')
+    result['statistic'] = statistic
+    result['p_value'] = p_val
+    return result
+
+
+def compare_regions(expert_grids, novice_grids, alpha):
+    '''
+    Run the select_test decision tree independently for every region cell.
+    expert_grids / novice_grids: (n_participants, n_cells) regional sparsity.
+    Cells where every participant has the same value (e.g. never fixated)
+    cannot be tested and are returned as NaN.
+    Returns (p_values, cohen_d) arrays of length n_cells.
+    '''
+    from question2 import cohens_d  # already loaded by the main script
+    n_cells = expert_grids.shape[1]
+    p_values = np.full(n_cells, np.nan)
+    effects = np.full(n_cells, np.nan)
+    for cell in range(n_cells):
+        exp_vals = expert_grids[:, cell]
+        nov_vals = novice_grids[:, cell]
+        if np.ptp(np.concatenate([exp_vals, nov_vals])) == 0:
+            continue
+        p_values[cell] = select_test(exp_vals, nov_vals, alpha)['p_value']
+        effects[cell] = cohens_d(exp_vals, nov_vals)
+    return p_values, effects
+
+
+if __name__ == "__main__":
+    # Q1/Q2 helpers are imported inside the main guard so that the sparsity worker
+    # processes (which re-import this module under the spawn start method) do not
+    # re-run the Q1/Q2 scripts.
+    from question1 import calculate_mean, calculate_median, calculate_variance, calculate_stddev, skewness, kurtosis
+    from question2 import calculate_descriptive_stats, cohens_d, interpret_cohens_d, ALPHA
+
+    # Heatmaps are read in sorted filename order on a process pool; each heatmap is decoded
+    # once for its overall and regional sparsity, fused statistics (heatmap_metrics.py) and
+    # its share of the group attention maps (attention_maps.py). The sparsity index stores
+    # all of them and only decodes again when a group directory has changed since the last run
+    with SparsityIndex() as index:
+        (expert_sparsity, expert_regions, expert_stats, expert_acc), \
+            (novice_sparsity, novice_regions, novice_stats, novice_acc) = \
+            index.load_groups(EXPERT_DIR, NOVICE_DIR, attention=True)
+    expert_sparsity = expert_sparsity.tolist()
+    novice_sparsity = novice_sparsity.tolist()
+
+    data = {
+        'sparsity': {
+        'experts': expert_sparsity,
+        'novices': novice_sparsity
+        }
+    }
+
+    # Descriptive Statistics
+    print("\nDescriptive Statistics for Fixation Sparsity")
+    exp_stats = calculate_descriptive_stats(data['sparsity']['experts'])
+    nov_stats = calculate_descriptive_stats(data['sparsity']['novices'])
+    print("Experts:", exp_stats)
+    print("Novices:", nov_stats)
+
+    # Normality Test - Shapiro-Wilk, Levene's Test and test selection (see select_test)
+    selection = select_test(data['sparsity']['experts'], data['sparsity']['novices'], ALPHA)
+    exp_normal, nov_normal = selection['exp_normal'], selection['nov_normal']
+    equal_var = selection['equal_var']
+
+    print("\nNormality Test - Shapiro-Wilk")
+    print(f"Experts: w={selection['exp_w']:.4f}, p={selection['exp_p']:.4f} => {'Normal' if exp_normal else 'Not Normal'}")
+    print(f"Novices: w={selection['nov_w']:.4f}, p={selection['nov_p']:.4f} => {'Normal' if nov_normal else 'Not Normal'}")
+
+    # Homogeneity of Variance - Levene's Test
+    print(f"\nLevene's Test: statistic={selection['lev_stat']:.4f}, p={selection['lev_p']:.4f} => {'Equal variance' if equal_var else 'Unequal variance'}")
+
+    print("\nStatistical Test Selection:")
+    test_name = selection['test_name']
+    p_val = selection['p_value']
+    if exp_normal and nov_normal:
+        variances = "equal variances" if equal_var else "unequal variances"
+        print(f"Both groups normal, {variances} -> {test_name}")
+        print(f"{test_name}: t={selection['statistic']:.4f}, p={p_val:.4f}")
+    else:
+        print(f"Normality violated -> {test_name}")
+        print(f"{test_name}: U={selection['statistic']:.4f}, p={p_val:.4f}")
+
+    # Effect Size
+    d = cohens_d(data['sparsity']['experts'], data['sparsity']['novices'])
+    significant = p_val < ALPHA
+
+    print(f"\nCohen's d: {d:.4f} ({interpret_cohens_d(d)})")
+    print(f"Significant at alpha={ALPHA}: {'Yes' if significant else 'No'}")
+
+    # Final Results Table
+    print("\n" + "=" * 100)
+    print("FINAL RESULTS TABLE")
+    print("=" * 100)
+    print(f"{'Metric':<20} {'Expert Median (IQR)':<25} {'Novice Median (IQR)':<25} {'p-value':>10} {'Cohen d':>10} {'Sig?':>6}")
+    print("-" * 100)
+
+    exp_str = f"{exp_stats['median']:.4f} ({exp_stats['q1']:.4f}-{exp_stats['q3']:.4f})"
+    nov_str = f"{nov_stats['median']:.4f} ({nov_stats['q1']:.4f}-{nov_stats['q3']:.4f})"
+    sig_str = "Yes" if significant else "No"
+
+    print(f"{'Fixation Sparsity':<20} {exp_str:<25} {nov_str:<25} {p_val:>10.4f} {d:>10.4f} {sig_str:>6}")
+    print("-" * 100)
+
+    # Regional sparsity: the same comparison for each cell of 4x4, 8x8 and 16x16 grids
+    # (one summed-area table per heatmap, read from the sparsity index)
+    region_p, region_d = compare_regions(expert_regions, novice_regions, ALPHA)
+
+    # One test per testable cell (up to 336), so the p-values are adjusted for the
+    # false discovery rate (Benjamini-Hochberg) over all tested cells before counting
+    tested = ~np.isnan(region_p)
+    region_q = np.full_like(region_p, np.nan)
+    if tested.any():
+        region_q[tested] = stats.false_discovery_control(region_p[tested])
+
+    print(f"\nRegional Fixation Sparsity (per grid cell, Benjamini-Hochberg FDR over {int(tested.sum())} tested cells)")
+    for n, p_grid, d_grid in zip(GRID_SIZES, split_grids(region_q), split_grids(region_d)):
+        n_sig = int(np.sum(p_grid < ALPHA))
+        n_tested = int(np.sum(~np.isnan(p_grid)))
+        print(f"{n}x{n} grid: {n_sig} / {n_tested} testable cells significant at FDR q < {ALPHA}")
+        if n == GRID_SIZES[0]:
+            print("FDR-adjusted p-values (rows = top to bottom):")
+            for row in p_grid:
+                print("  " + " ".join(f"{p:>8.4f}" if not np.isnan(p) else f"{'N/A':>8}" for p in row))
+
+    # Fused heatmap statistics: the same decision tree on the attention entropy and spatial
+    # dispersion of each heatmap (undefined, NaN, for a completely white heatmap)
+    print("\nFused Heatmap Statistics (attention weight w = 255 - grayscale value)")
+    for field, label in (('entropy', 'Attention entropy (nats)'), ('dispersion', 'Spatial dispersion (px)')):
+        exp_vals = expert_stats[field][~np.isnan(expert_stats[field])]
+        nov_vals = novice_stats[field][~np.isnan(novice_stats[field])]
+        stat_selection = select_test(exp_vals, nov_vals, ALPHA)
+        print(f"{label:<26} expert median={np.median(exp_vals):.4f}, novice median={np.median(nov_vals):.4f}, "
+              f"{stat_selection['test_name']} p={stat_selection['p_value']:.4f}, "
+              f"Cohen's d={cohens_d(exp_vals, nov_vals):.4f}")
+
+    # Group attention maps: per-pixel Welch's t-test of expert vs novice attention,
+    # Benjamini-Hochberg FDR over all tested pixels (see attention_maps.difference_map)
+    diff = difference_map(expert_acc, novice_acc)
+    significant = diff['q'] < ALPHA
+    print(f"\nPixels with significant expert-novice attention difference (FDR q < {ALPHA}): "
+          f"{np.count_nonzero(significant)} ({np.mean(significant) * 100:.2f}%)")
+
+    # Raw fixation logs: when the eye-tracker logs are exported alongside the heatmaps,
+    # the same comparison is run on sparsity stamped directly from the fixation records
+    # (plus the duration-weighted variant), without rendering any heatmap
+    if os.path.isdir(EXPERT_LOG_DIR) and os.path.isdir(NOVICE_LOG_DIR):
+        expert_logs, novice_logs = load_group_log_sparsity(EXPERT_LOG_DIR, NOVICE_LOG_DIR, weighted=True)
+        print(f"\nFixation Sparsity from raw fixation logs ({len(expert_logs)} expert, {len(novice_logs)} novice logs)")
+        for key, label in (('sparsity', 'Fixation sparsity'), ('weighted_sparsity', 'Duration-weighted')):
+            exp_vals = [result[key] for result in expert_logs]
+            nov_vals = [result[key] for result in novice_logs]
+            log_selection = select_test(exp_vals, nov_vals, ALPHA)
+            print(f"{label}: {log_selection['test_name']} p={log_selection['p_value']:.4f}, "
+                  f"Cohen's d={cohens_d(exp_vals, nov_vals):.4f}")
+
+    # Generate box plot for fixation sparsity
+    import matplotlib.pyplot as plt
+    os.makedirs('figures', exist_ok=True)
+
+    plt.figure(figsize=(8, 5))
+    bp = plt.boxplot(
+        [data['sparsity']['experts'], data['sparsity']['novices']],
+        tick_labels=['Experts', 'Novices'],
+        patch_artist=True
+    )
+    bp['boxes'][0].set_facecolor('blue')
+    bp['boxes'][0].set_alpha(0.7)
+    bp['boxes'][1].set_facecolor('orange')
+    bp['boxes'][1].set_alpha(0.7)
+    plt.title('Fixation Sparsity - Experts vs Novices')
+    plt.ylabel('Sparsity (ratio)')
+    plt.tight_layout()
+    plt.savefig('figures/boxplot_q4_fixation_sparsity.png', dpi=150)
+    plt.show()
+    print("Saved: figures/boxplot_q4_fixation_sparsity.png")
+
+    # Group mean attention maps and the FDR-masked difference map
+    plot_group_maps(expert_acc, novice_acc, diff, ALPHA, 'figures/attention_q4_group_maps.png')
+    print("Saved: figures/attention_q4_group_maps.png")
\ No newline at end of file
@@ -0,0 +1,230 @@
+# Fixation sparsity for MPHY0047 Coursework 1.
+# Reads the fixation heatmaps (PNG) of each group and reduces each image to its
+# fixation sparsity. Directories are scanned in sorted filename order and images
+# are decoded on a process pool, so results are reproducible and scale to large
+# eye-tracking exports.
+
+import os
+import functools
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+
+EXPERT_DIR = "fixation_maps/fixation_maps/experts"
+NOVICE_DIR = "fixation_maps/fixation_maps/novice"
+CHUNK_SIZE = 32  # images handed to a worker at a time
+ROW_CHUNK = 64  # image rows reduced per step of the chunked heatmap reductions (heatmap_metrics)
+GRID_SIZES = (4, 8, 16)  # regional sparsity grids (n x n cells)
+
+# PIL grayscale conversion weights (ITU-R 601-2 luma, scaled by 2^16)
+LUMA_WEIGHTS = (19595, 38470, 7471)
+# Weighted RGB sum below this value has grayscale value < 255 (non-white)
+NONWHITE_LIMIT = 255 * 2 ** 16 - 2 ** 15
+
+
+def count_nonwhite(gray):
+    '''
+    Count non-white pixels (grayscale value < 255) of a decoded (H, W) grayscale heatmap.
+    '''
+    return int(np.count_nonzero(gray < 255))
+
+
+def count_nonwhite_image(img):
+    '''
+    Count non-white pixels of an opened PIL image. Palette images are counted
+    from a histogram of palette indices; any other mode is converted to
+    grayscale by PIL ('L') and counted with count_nonwhite.
+    '''
+    if img.mode == 'P':
+        palette = np.array(img.getpalette('RGB'), dtype=np.uint32).reshape(-1, 3)
+        luma = palette @ np.array(LUMA_WEIGHTS, dtype=np.uint32)
+        nonwhite_entry = np.ones(256, dtype=bool)  # indices beyond the palette decode as black
+        nonwhite_entry[:len(luma)] = luma < NONWHITE_LIMIT
+        histogram = np.bincount(np.asarray(img).ravel(), minlength=256)
+        return int(histogram[nonwhite_entry].sum())
+    if img.mode != 'L':
+        img = img.convert('L')
+    return count_nonwhite(np.asarray(img))
+
+
+def nonwhite_mask(image_path):
+    '''
+    Boolean (H, W) mask of the non-white (fixated) pixels of a heatmap,
+    using the same grayscale < 255 rule as calculate_sparsity.
+    '''
+    with Image.open(image_path) as img:
+        if img.mode == 'P':
+            palette = np.array(img.getpalette('RGB'), dtype=np.uint32).reshape(-1, 3)
+            nonwhite_entry = np.ones(256, dtype=bool)
+            nonwhite_entry[:len(palette)] = palette @ np.array(LUMA_WEIGHTS, dtype=np.uint32) < NONWHITE_LIMIT
+            return nonwhite_entry[np.asarray(img)]
+        if img.mode != 'L':
+            img = img.convert('L')
+        return np.asarray(img) < 255
+
+
+def calculate_sparsity(image_path):
+    '''
+    Calculates the fixation sparsity for a single heatmap image.
+    Formula: Sparsity = N_nonwhite / (W * H)
+    where W, H are the actual image dimensions (1920 x 1080 for the coursework
+    heatmaps, total = 2,073,600 pixels).
+    Non-white pixels (grayscale value < 255) indicate locations where fixations were recorded.
+    Higher sparsity = more dispersed gaze; lower sparsity = more focused attention.
+    '''
+    with Image.open(image_path) as img:
+        width, height = img.size
+        non_white_count = count_nonwhite_image(img) # Counts non-white pixels
+    sparsity = non_white_count / (width * height)
+    return sparsity
+
+
+def scan_heatmaps(directory):
+    '''
+    List the PNG heatmaps in a directory, sorted by filename.
+    Sorting makes the order of the sparsity arrays deterministic
+    (os.listdir/os.scandir order depends on the filesystem).
+    '''
+    with os.scandir(directory) as entries:
+        names = sorted(entry.name for entry in entries
+                       if entry.is_file() and entry.name.endswith('.png'))
+    return [os.path.join(directory, name) for name in names]
+
+
+def compute_sparsity(paths, workers=None, chunk_size=CHUNK_SIZE):
+    '''
+    Compute the sparsity of every heatmap in paths, in the same order as paths.
+    Images are decoded and reduced on a pool of worker processes in chunks of
+    chunk_size images; workers=1 (or a single chunk) runs serially.
+    Returns a numpy array of sparsity values.
+    '''
+    paths = list(paths)
+    if workers == 1 or len(paths) <= chunk_size:
+        return np.array([calculate_sparsity(path) for path in paths], dtype=np.float64)
+
+    # Executor.map yields results in submission order, whatever order chunks finish in
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        values = list(pool.map(calculate_sparsity, paths, chunksize=chunk_size))
+    return np.array(values, dtype=np.float64)
+
+
+def load_group_sparsity(expert_dir=EXPERT_DIR, novice_dir=NOVICE_DIR, workers=None):
+    '''
+    Scan both group directories and compute sparsity for all heatmaps in one pool.
+    Returns (expert_sparsity, novice_sparsity) as numpy arrays in sorted filename order.
+    '''
+    expert_paths = scan_heatmaps(expert_dir)
+    novice_paths = scan_heatmaps(novice_dir)
+    values = compute_sparsity(expert_paths + novice_paths, workers=workers)
+    return values[:len(expert_paths)], values[len(expert_paths):]
+
+
+def summed_area_table(mask):
+    '''
+    Summed-area table of a boolean mask, with a zero first row and column:
+      S[y, x] = number of set pixels in mask[:y, :x]      shape (H + 1, W + 1)
+    Built once with two cumulative sums; any rectangle count is then O(1).
+    '''
+    height, width = mask.shape
+    sat = np.zeros((height + 1, width + 1), dtype=np.int32)
+    np.cumsum(mask, axis=0, dtype=np.int32, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def rect_sparsity(sat, y0, x0, y1, x1):
+    '''
+    Sparsity of the rectangle rows y0..y1-1, columns x0..x1-1 from a summed-area table.
+    Formula: N = S[y1, x1] - S[y0, x1] - S[y1, x0] + S[y0, x0]
+             Sparsity = N / ((y1 - y0) * (x1 - x0))
+    Bounds may be arrays (broadcast), giving many rectangles in one call.
+    '''
+    count = sat[y1, x1] - sat[y0, x1] - sat[y1, x0] + sat[y0, x0]
+    return count / ((y1 - y0) * (x1 - x0))
+
+
+def grid_sparsity(sat, n):
+    '''
+    Sparsity of each cell of an n x n grid over the image, as an (n, n) array.
+    Cell edges are rounded so cells differ in size by at most one pixel.
+    '''
+    height, width = sat.shape[0] - 1, sat.shape[1] - 1
+    ys = np.rint(np.linspace(0, height, n + 1)).astype(np.intp)
+    xs = np.rint(np.linspace(0, width, n + 1)).astype(np.intp)
+    return rect_sparsity(sat, ys[:-1, None], xs[None, :-1], ys[1:, None], xs[None, 1:])
+
+
+def regional_sparsity(image_path, grid_sizes=GRID_SIZES):
+    '''
+    Multi-scale regional sparsity of one heatmap.
+    The non-white mask is scanned once into a summed-area table, and every
+    grid cell is read from the table, so regions never re-scan the image.
+    Returns one flat array: the n x n grids of grid_sizes concatenated in
+    row-major order (16 + 64 + 256 = 336 values for the default 4/8/16 grids).
+    '''
+    sat = summed_area_table(nonwhite_mask(image_path))
+    return np.concatenate([grid_sparsity(sat, n).ravel() for n in grid_sizes])
+
+
+def split_grids(values, grid_sizes=GRID_SIZES):
+    '''
+    Split flat regional sparsity values (..., sum(n^2)) back into a list of
+    (..., n, n) grids, one per grid size.
+    '''
+    bounds = np.cumsum([0] + [n * n for n in grid_sizes])
+    return [values[..., b0:b1].reshape(values.shape[:-1] + (n, n))
+            for n, b0, b1 in zip(grid_sizes, bounds[:-1], bounds[1:])]
+
+
+def compute_regional_sparsity(paths, grid_sizes=GRID_SIZES, workers=None, chunk_size=CHUNK_SIZE):
+    '''
+    Regional sparsity of every heatmap in paths on the process pool.
+    Returns an (N, sum(n^2)) array in the order of paths.
+    '''
+    paths = list(paths)
+    reduce = functools.partial(regional_sparsity, grid_sizes=tuple(grid_sizes))
+    if not paths:
+        return np.empty((0, sum(n * n for n in grid_sizes)))
+    if workers == 1 or len(paths) <= chunk_size:
+        return np.stack([reduce(path) for path in paths])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return np.stack(list(pool.map(reduce, paths, chunksize=chunk_size)))
+
+
+def mask_sparsity_and_regions(mask, grid_sizes=GRID_SIZES):
+    '''
+    Overall and regional sparsity of an (H, W) non-white mask.
+    The overall count is the last entry of the summed-area table.
+    Returns (sparsity, regions) with regions as in regional_sparsity.
+    '''
+    sat = summed_area_table(mask)
+    sparsity = int(sat[-1, -1]) / mask.size
+    return sparsity, np.concatenate([grid_sparsity(sat, n).ravel() for n in grid_sizes])
+
+
+def sparsity_and_regions(image_path, grid_sizes=GRID_SIZES):
+    '''
+    Overall and regional sparsity of one heatmap from a single decode; the
+    sparsity equals calculate_sparsity(image_path) exactly.
+    Returns (sparsity, regions) with regions as in regional_sparsity.
+    '''
+    return mask_sparsity_and_regions(nonwhite_mask(image_path), grid_sizes)
+
+
+def compute_sparsity_and_regions(paths, grid_sizes=GRID_SIZES, workers=None, chunk_size=CHUNK_SIZE):
+    '''
+    Overall and regional sparsity of every heatmap in paths on the process pool,
+    decoding each heatmap once.
+    Returns (sparsity, regions): an (N,) and an (N, sum(n^2)) array in the order of paths.
+    '''
+    paths = list(paths)
+    reduce = functools.partial(sparsity_and_regions, grid_sizes=tuple(grid_sizes))
+    if not paths:
+        return np.empty(0), np.empty((0, sum(n * n for n in grid_sizes)))
+    if workers == 1 or len(paths) <= chunk_size:
+        results = [reduce(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(reduce, paths, chunksize=chunk_size))
+    return (np.array([value for value, _ in results], dtype=np.float64),
+            np.stack([regions for _, regions in results]))
@@ -0,0 +1,222 @@
+# Persistent sparsity index for the fixation heatmap directories.
+# Stores one row per heatmap (path, size, mtime, content hash, sparsity and, once
+# requested, its regional grid sparsity) in SQLite, so reruns only decode heatmaps
+# that are new or have changed since the last run.
+#   - size and mtime unchanged        -> stored sparsity reused, file not read
+#   - size/mtime changed, same hash   -> stat refreshed, sparsity reused
+#   - new file or content changed     -> sparsity recomputed (process pool)
+#   - regions requested but not stored -> sparsity and regions recomputed (one decode)
+#   - file no longer on disk          -> row dropped
+# With attention maps requested, each directory also stores its group attention sums
+# (attention_maps.py) and the heatmaps' fused statistics (heatmap_metrics.py), under a
+# fingerprint of the directory's (name, hash) list. The sums cannot be updated per
+# heatmap, so when the fingerprint changes every heatmap of the directory is decoded
+# once, for its sparsity, regions, statistics and attention together.
+
+import hashlib
+import os
+import sqlite3
+import numpy as np
+from sparsity import compute_sparsity, compute_sparsity_and_regions, EXPERT_DIR, NOVICE_DIR, GRID_SIZES
+from attention_maps import AttentionAccumulator, accumulate_group
+from heatmap_metrics import metrics_dtype, DEFAULT_METRICS
+
+# Next to the heatmaps, resolved from this file so the index does not depend on the working directory
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixation_maps", "sparsity_index.sqlite")
+HASH_BLOCK = 1 << 20  # bytes read per step when hashing a heatmap
+REGION_CELLS = sum(n * n for n in GRID_SIZES)  # regional values stored per heatmap
+STATISTICS_DTYPE = metrics_dtype(DEFAULT_METRICS)  # fused statistics stored per heatmap
+
+
+def file_digest(path):
+    '''
+    BLAKE2b content hash of a file, read in blocks.
+    '''
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SparsityIndex:
+    '''
+    SQLite-backed cache of heatmap sparsity values, keyed by absolute path
+    and validated by file size, modification time (ns) and content hash.
+    '''
+
+    def __init__(self, db_path=INDEX_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS heatmaps ("
+            " path TEXT PRIMARY KEY, directory TEXT NOT NULL, name TEXT NOT NULL,"
+            " size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,"
+            " digest TEXT NOT NULL, sparsity REAL NOT NULL, regions BLOB, statistics BLOB)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS heatmaps_directory ON heatmaps (directory)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS attention ("
+            " directory TEXT PRIMARY KEY, fingerprint TEXT NOT NULL,"
+            " height INTEGER NOT NULL, width INTEGER NOT NULL, count INTEGER NOT NULL,"
+            " total BLOB NOT NULL, sum_sq BLOB NOT NULL)")
+        # Indexes created before regional sparsity / statistics were stored lack those columns
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(heatmaps)")]
+        with self.conn:
+            for column in ('regions', 'statistics'):
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE heatmaps ADD COLUMN {column} BLOB")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, directory, workers=None, regions=False, attention=False):
+        '''
+        Rescan a heatmap directory and bring its index rows up to date.
+        Returns the sparsity of every PNG in the directory as a numpy array,
+        in sorted filename order. With regions=True, also returns the regional
+        sparsity (N, REGION_CELLS) of the GRID_SIZES grids (see sparsity.py);
+        heatmaps whose regions are not stored yet are decoded once for both.
+        With attention=True, returns (sparsity, regions, statistics, accumulator):
+        the fused statistics (N,) of STATISTICS_DTYPE and the group's
+        AttentionAccumulator, reused while the directory is unchanged and
+        otherwise rebuilt from one decode of every heatmap (accumulate_group).
+        '''
+        directory = os.path.abspath(directory)
+        with os.scandir(directory) as entries:
+            on_disk = {entry.name: entry.stat() for entry in entries
+                       if entry.is_file() and entry.name.endswith('.png')}
+
+        stored = {name: (size, mtime_ns, digest, sparsity, blob, stats_blob)
+                  for name, size, mtime_ns, digest, sparsity, blob, stats_blob
+                  in self.conn.execute("SELECT name, size, mtime_ns, digest, sparsity, regions, statistics"
+                                       " FROM heatmaps WHERE directory = ?", (directory,))}
+
+        scanned = []  # (name, stat, digest) of every heatmap on disk, in name order
+        for name in sorted(on_disk):
+            st = on_disk[name]
+            row = stored.get(name)
+            unchanged = row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns
+            digest = row[2] if unchanged else file_digest(os.path.join(directory, name))
+            scanned.append((name, st, digest))
+
+        group = None
+        if attention:
+            fingerprint = _fingerprint(scanned)
+            group = self.conn.execute("SELECT fingerprint, height, width, count, total, sum_sq"
+                                      " FROM attention WHERE directory = ?", (directory,)).fetchone()
+            complete = (group is not None and group[0] == fingerprint
+                        and all(name in stored and _has_regions(stored[name][4])
+                                and _has_statistics(stored[name][5]) for name, _, _ in scanned))
+            to_compute = [] if complete else scanned
+        else:
+            to_compute = [(name, st, digest) for name, st, digest in scanned
+                          if name not in stored or stored[name][2] != digest
+                          or (regions and not _has_regions(stored[name][4]))]
+        computing = {name for name, _, _ in to_compute}
+        # Rows kept as stored whose stat changed (same content)
+        refreshed = [(name, st, digest) + stored[name][3:] for name, st, digest in scanned
+                     if name not in computing and (stored[name][0], stored[name][1]) != (st.st_size, st.st_mtime_ns)]
+
+        paths = [os.path.join(directory, name) for name, _, _ in to_compute]
+        stats_blobs = [None] * len(paths)
+        if attention and paths:
+            values, grids, statistics, accumulator = accumulate_group(paths, workers)
+            blobs = [grid.astype(np.float64).tobytes() for grid in grids]
+            stats_blobs = [record.tobytes() for record in statistics.astype(STATISTICS_DTYPE)]
+        elif attention:
+            values, blobs, accumulator = [], [], _load_accumulator(group)
+        elif regions:
+            values, grids = compute_sparsity_and_regions(paths, workers=workers)
+            blobs = [grid.astype(np.float64).tobytes() for grid in grids]
+        else:
+            values = compute_sparsity(paths, workers=workers)
+            blobs = [None] * len(paths)
+        changed = refreshed + [(name, st, digest, float(value), blob, stats_blob)
+                               for (name, st, digest), value, blob, stats_blob
+                               in zip(to_compute, values, blobs, stats_blobs)]
+        deleted = [name for name in stored if name not in on_disk]
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO heatmaps"
+                " (path, directory, name, size, mtime_ns, digest, sparsity, regions, statistics)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(os.path.join(directory, name), directory, name, st.st_size, st.st_mtime_ns, digest,
+                  value, blob, stats_blob)
+                 for name, st, digest, value, blob, stats_blob in changed])
+            self.conn.executemany("DELETE FROM heatmaps WHERE path = ?",
+                                  [(os.path.join(directory, name),) for name in deleted])
+            if attention and paths:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO attention (directory, fingerprint, height, width, count, total, sum_sq)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (directory, fingerprint, accumulator.shape[0], accumulator.shape[1], accumulator.count,
+                     accumulator.total.tobytes(), accumulator.sum_sq.tobytes()))
+
+        rows = self.conn.execute("SELECT sparsity, regions, statistics FROM heatmaps WHERE directory = ?"
+                                 " ORDER BY name", (directory,)).fetchall()
+        sparsity = np.array([value for value, _, _ in rows], dtype=np.float64)
+        if not (regions or attention):
+            return sparsity
+        grids = np.array([np.frombuffer(blob, dtype=np.float64) for _, blob, _ in rows], dtype=np.float64)
+        grids = grids.reshape(len(rows), REGION_CELLS)
+        if not attention:
+            return sparsity, grids
+        statistics = np.frombuffer(b''.join(blob for _, _, blob in rows), dtype=STATISTICS_DTYPE)
+        return sparsity, grids, statistics, accumulator
+
+    def load_groups(self, expert_dir=EXPERT_DIR, novice_dir=NOVICE_DIR, workers=None, regions=False,
+                    attention=False):
+        '''
+        Update the index for both group directories.
+        Returns (expert_sparsity, novice_sparsity) in sorted filename order;
+        with regions=True, each is a (sparsity, regions) pair, and with
+        attention=True a (sparsity, regions, statistics, accumulator) tuple (see update).
+        '''
+        return (self.update(expert_dir, workers, regions, attention),
+                self.update(novice_dir, workers, regions, attention))
+
+
+def _has_regions(blob):
+    '''
+    True if a stored regions blob holds the regional sparsity of the current GRID_SIZES.
+    '''
+    return blob is not None and len(blob) == REGION_CELLS * np.dtype(np.float64).itemsize
+
+
+def _has_statistics(blob):
+    '''
+    True if a stored statistics blob holds one record of the current STATISTICS_DTYPE.
+    '''
+    return blob is not None and len(blob) == STATISTICS_DTYPE.itemsize
+
+
+def _fingerprint(scanned):
+    '''
+    BLAKE2b hash of a directory's sorted (name, content hash) list: changes
+    whenever a heatmap is added, removed or its content changes.
+    '''
+    digest = hashlib.blake2b(digest_size=20)
+    for name, _, file_hash in scanned:
+        digest.update(f"{name}\0{file_hash}\n".encode())
+    return digest.hexdigest()
+
+
+def _load_accumulator(row):
+    '''
+    Rebuild the AttentionAccumulator of a stored attention row
+    (fingerprint, height, width, count, total, sum_sq).
+    '''
+    _, height, width, count, total, sum_sq = row
+    accumulator = AttentionAccumulator((height, width))
+    accumulator.total[...] = np.frombuffer(total, dtype=accumulator.total.dtype).reshape(height, width)
+    accumulator.sum_sq[...] = np.frombuffer(sum_sq, dtype=accumulator.sum_sq.dtype).reshape(height, width)
+    accumulator.count = count
+    return accumulator
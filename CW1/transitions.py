@@ -0,0 +1,178 @@
+# Gesture transition analysis for MPHY0047 Coursework 1.
+# Treats each gesture sequence as a first-order Markov chain over the five
+# surgical gestures (S1-S5), so the order of gestures is kept rather than
+# being reduced to an error count. Counting is done in one vectorised pass
+# over all sequences, which scales to millions of sequences.
+
+import itertools
+import numpy as np
+
+NUM_GESTURES = 5  # S1 ... S5, stored as 0-indexed state codes 0 ... 4
+PERMUTATION_BUDGET = 2 ** 24  # max elements in one batch of permuted group indicators
+
+
+def pack_sequences(sequences):
+    '''
+    Flatten ragged gesture sequences into one contiguous array.
+    Gestures are shifted to 0-indexed state codes (S1 -> 0, ..., S5 -> 4).
+    Returns (flat, lengths) where lengths[i] is the length of sequence i.
+    '''
+    lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))
+    flat = np.fromiter(itertools.chain.from_iterable(sequences), dtype=np.int64,
+                       count=int(lengths.sum()))
+    return flat - 1, lengths
+
+
+def bigram_counts(flat, lengths, owners=None, n_owners=None, n_states=NUM_GESTURES):
+    '''
+    Count gesture bigrams (a -> b) for every owner in a single bincount pass.
+    Each sequence i belongs to owner owners[i] (a participant or a group);
+    by default every sequence is its own owner.
+    Bigrams never cross a sequence boundary: the position before each
+    sequence start is masked out.
+    Each bigram is encoded as code = (owner * K + a) * K + b, with K = n_states,
+    so one np.bincount gives the full (n_owners, K, K) count tensor.
+    Raises ValueError if a state code is outside 0 ... n_states - 1 or an owner
+    outside 0 ... n_owners - 1, since such codes would be counted in another
+    owner's or state's cell.
+    '''
+    flat = np.asarray(flat, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if owners is None:
+        owners = np.arange(len(lengths))
+    owners = np.asarray(owners, dtype=np.int64)
+    if n_owners is None:
+        n_owners = int(owners.max()) + 1 if len(owners) else 0
+    if len(owners) != len(lengths):
+        raise ValueError(f"Got {len(owners)} owners for {len(lengths)} sequences")
+    if len(flat) and (flat.min() < 0 or flat.max() >= n_states):
+        raise ValueError(f"State codes must be in 0 ... {n_states - 1}, got {flat.min()} ... {flat.max()}")
+    if len(owners) and (owners.min() < 0 or owners.max() >= n_owners):
+        raise ValueError(f"Owners must be in 0 ... {n_owners - 1}, got {owners.min()} ... {owners.max()}")
+
+    n = len(flat)
+    if n < 2:
+        return np.zeros((n_owners, n_states, n_states), dtype=np.int64)
+
+    # Position i is a valid bigram start unless i + 1 begins a new sequence
+    valid = np.ones(n - 1, dtype=bool)
+    starts = np.cumsum(lengths)[:-1]
+    starts = starts[(starts > 0) & (starts < n)]
+    valid[starts - 1] = False
+
+    position_owner = np.repeat(owners, lengths)[:-1][valid]
+    src = flat[:-1][valid]
+    dst = flat[1:][valid]
+
+    codes = (position_owner * n_states + src) * n_states + dst
+    counts = np.bincount(codes, minlength=n_owners * n_states * n_states)
+    return counts.reshape(n_owners, n_states, n_states)
+
+
+def transition_probabilities(counts):
+    '''
+    Row-normalise bigram counts into transition probabilities.
+    Formula: P(b | a) = C(a -> b) / sum_b' C(a -> b')
+    Rows of gestures that are never left (zero row sum) are returned as zeros.
+    Works on a single (K, K) matrix or a stack (..., K, K).
+    '''
+    counts = np.asarray(counts, dtype=np.float64)
+    row_sums = counts.sum(axis=-1, keepdims=True)
+    return np.divide(counts, row_sums, out=np.zeros_like(counts), where=row_sums > 0)
+
+
+def _group_distance(group_counts, total_counts):
+    '''
+    L1 distance between the transition matrices of group 1 and group 0.
+    group_counts: (B, K*K) pooled counts of group 1 for B labellings.
+    total_counts: (K*K,) pooled counts of all participants.
+    Returns (per-batch distance, per-cell absolute differences).
+    '''
+    k = int(np.sqrt(total_counts.shape[-1]))
+    g1 = transition_probabilities(group_counts.reshape(-1, k, k))
+    g0 = transition_probabilities((total_counts - group_counts).reshape(-1, k, k))
+    cell_diff = np.abs(g1 - g0)
+    return cell_diff.sum(axis=(1, 2)), cell_diff
+
+
+def permutation_test(counts, labels, n_permutations=10000, seed=0):
+    '''
+    Permutation test for a difference in transition matrices between two groups.
+    Test statistic: T = sum_ab |P_1(b | a) - P_0(b | a)|
+    where P_g is the transition matrix of the pooled bigram counts of group g.
+      H0: experts and novices share the same transition matrix
+      H1: the transition matrices differ
+    Group labels are shuffled across participants; permutations are evaluated
+    in batches, with pooled group counts obtained as one matrix product
+    (indicator matrix @ per-participant counts) per batch.
+    p-value = (1 + #{T_perm >= T_obs}) / (1 + n_permutations)
+    Also returns per-cell p-values for each transition a -> b.
+    '''
+    counts = np.asarray(counts, dtype=np.float64)
+    labels = np.asarray(labels).astype(bool)
+    n_participants, k, _ = counts.shape
+    flat_counts = counts.reshape(n_participants, k * k)
+    total = flat_counts.sum(axis=0)
+
+    observed, observed_cells = _group_distance(flat_counts[labels].sum(axis=0)[None, :], total)
+    observed, observed_cells = observed[0], observed_cells[0]
+
+    rng = np.random.default_rng(seed)
+    batch_size = max(1, min(n_permutations, PERMUTATION_BUDGET // max(n_participants, 1)))
+    exceed = 0
+    cell_exceed = np.zeros((k, k), dtype=np.int64)
+    done = 0
+    while done < n_permutations:
+        b = min(batch_size, n_permutations - done)
+        # Each row of the indicator matrix is one shuffled labelling
+        indicators = rng.permuted(np.broadcast_to(labels, (b, n_participants)), axis=1)
+        group_counts = indicators.astype(np.float64) @ flat_counts
+        stat, cells = _group_distance(group_counts, total)
+        exceed += int(np.sum(stat >= observed - 1e-12))
+        cell_exceed += np.sum(cells >= observed_cells - 1e-12, axis=0)
+        done += b
+
+    return {
+        'statistic': observed,
+        'p_value': (1 + exceed) / (1 + n_permutations),
+        'cell_difference': observed_cells,
+        'cell_p_values': (1 + cell_exceed) / (1 + n_permutations),
+        'n_permutations': n_permutations
+    }
+
+
+def compare_groups(expert_sequences, novice_sequences, n_permutations=10000, seed=0):
+    '''
+    Build per-participant and per-group transition matrices for experts and
+    novices, and run the permutation test between the groups.
+    Each sequence is one participant. Returns a dict of counts, transition
+    probabilities and the permutation test results.
+    '''
+    sequences = list(expert_sequences) + list(novice_sequences)
+    labels = np.array([1] * len(expert_sequences) + [0] * len(novice_sequences))
+    flat, lengths = pack_sequences(sequences)
+
+    participant_counts = bigram_counts(flat, lengths)
+    expert_counts = participant_counts[labels == 1].sum(axis=0)
+    novice_counts = participant_counts[labels == 0].sum(axis=0)
+
+    return {
+        'participant_counts': participant_counts,
+        'expert_counts': expert_counts,
+        'novice_counts': novice_counts,
+        'expert_transitions': transition_probabilities(expert_counts),
+        'novice_transitions': transition_probabilities(novice_counts),
+        'test': permutation_test(participant_counts, labels, n_permutations, seed)
+    }
+
+
+def print_transition_matrix(matrix, title):
+    '''
+    Print a transition matrix with S1-S5 row/column labels.
+    '''
+    k = matrix.shape[0]
+    print(title)
+    print(f"{'from/to':<8}" + "".join(f"{'S' + str(j + 1):>7}" for j in range(k)))
+    for i in range(k):
+        print(f"{'S' + str(i + 1):<8}" + "".join(f"{matrix[i, j]:>7.2f}" for j in range(k)))
+    print()
@@ -0,0 +1,126 @@
+# Scalable participant/view iteration for the CW2 pipeline.
+# The scripts assume the fixed 20 x 10 layout of cw2.mat, with groups given by
+# index ranges. A Cohort instead reads its sizes, validity and group labels from
+# the on-disk image store (dataloader.ImageStore), streams (participant-chunk, view)
+# blocks of images from the memory-mapped view files, and writes per-entry results
+# into an on-disk ResultGrid as each block finishes. Memory use is bounded by the
+# chunk size, not by the number of participants. Group labels default to the
+# EXPERT_RANGE / NOVICE_RANGE index ranges, or come from an external label column
+# passed when the store is opened.
+
+import os
+import numpy as np
+from dataloader import dataset as default_dataset, STORE_DIR
+
+CHUNK_PARTICIPANTS = 256  # participants per block yielded by Cohort.blocks
+RESULTS_DIR = 'CW2/Provided/results'
+
+
+class Cohort:
+    """
+    Participants x views layout of an image store.
+    num_participants, num_views: read from the store
+    valid:  (participants, views) bool validity of each entry
+    groups: (participants,) group label of each participant
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.num_participants = store.num_participants
+        self.num_views = store.num_views
+        self.valid = store.valid
+        self.groups = store.groups
+
+    @classmethod
+    def open(cls, store_dir=STORE_DIR, dataset=default_dataset, labels=None):
+        """
+        Cohort of the image store in store_dir (converting cw2.mat into it on first use).
+        labels: optional (participants,) group label of each participant, e.g. an
+                external label column; by default EXPERT_RANGE / NOVICE_RANGE are used.
+        """
+        return cls(dataset.open_store(store_dir, labels))
+
+    def group_labels(self):
+        """Distinct group labels, in order of first appearance."""
+        labels, first = np.unique(self.groups, return_index=True)
+        return [str(label) for label in labels[np.argsort(first)]]
+
+    def group_rows(self, label):
+        """Participant indices with the given group label."""
+        return np.flatnonzero(self.groups == label)
+
+    def group_values(self, grid, view_idx, label):
+        """Valid, non-NaN values of one view of a result grid for one group."""
+        rows = self.group_rows(label)
+        values = np.asarray(grid[rows, view_idx], dtype=np.float64)
+        return values[self.valid[rows, view_idx] & ~np.isnan(values)]
+
+    def blocks(self, chunk=CHUNK_PARTICIPANTS, views=None):
+        """
+        Generator over (participant-chunk, view) blocks, view-major.
+        Yields (p0, p1, v, images, gold, valid) where images is the
+        (p1 - p0, H, W) memory-mapped slice of view v, gold the view's gold
+        standard and valid the (p1 - p0,) validity of the chunk. Only the chunk
+        being processed is paged in from disk.
+        """
+        for p0, p1, v in self.block_ranges(chunk, views):
+            yield p0, p1, v, self.store.view(v)[p0:p1], self.store.gold(v), self.valid[p0:p1, v]
+
+    def block_ranges(self, chunk=CHUNK_PARTICIPANTS, views=None):
+        """(p0, p1, v) of every block of blocks(), view-major, without reading any images."""
+        for v in range(self.num_views) if views is None else views:
+            for p0 in range(0, self.num_participants, chunk):
+                yield p0, min(p0 + chunk, self.num_participants), v
+
+    def result_grid(self, name, results_dir=RESULTS_DIR):
+        """Open (or create) the on-disk participants x views result grid called name."""
+        return ResultGrid(os.path.join(results_dir, name), (self.num_participants, self.num_views))
+
+    def compute(self, func, name, chunk=CHUNK_PARTICIPANTS, results_dir=RESULTS_DIR):
+        """
+        Fill a result grid with func(images, gold, valid) -> (chunk,) values for every
+        block, skipping blocks already completed by an earlier (interrupted) run.
+        Returns the ResultGrid.
+        """
+        grid = self.result_grid(name, results_dir)
+        for p0, p1, v, images, gold, valid in self.blocks(chunk):
+            if grid.done[p0:p1, v].all():
+                continue
+            grid.write(p0, p1, v, np.where(valid, func(images, gold, valid), np.nan))
+        grid.flush()
+        return grid
+
+
+class ResultGrid:
+    """
+    Participants x views float64 result grid stored as <path>.npy (NaN until
+    written), with a <path>.done.npy bool grid marking the written entries so an
+    interrupted run can resume. Both files are memory-mapped.
+    """
+
+    def __init__(self, path, shape):
+        self.path = path
+        values_path, done_path = path + '.npy', path + '.done.npy'
+        if os.path.exists(values_path) and os.path.exists(done_path):
+            self.values = np.load(values_path, mmap_mode='r+')
+            self.done = np.load(done_path, mmap_mode='r+')
+            if self.values.shape != tuple(shape):
+                raise ValueError(f"Result grid {values_path} has shape {self.values.shape}, expected {tuple(shape)}")
+        else:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self.values = np.lib.format.open_memmap(values_path, mode='w+', dtype=np.float64, shape=tuple(shape))
+            self.values[:] = np.nan
+            self.done = np.lib.format.open_memmap(done_path, mode='w+', dtype=bool, shape=tuple(shape))
+        self.shape = self.values.shape
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def write(self, p0, p1, v, values):
+        """Write the results of participants p0..p1-1 for view v."""
+        self.values[p0:p1, v] = values
+        self.done[p0:p1, v] = True
+
+    def flush(self):
+        self.values.flush()
+        self.done.flush()
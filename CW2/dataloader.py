@@ -1,19 +1,19 @@
 # Data loader for MPHY0047 Coursework 2.
 # Loads image data and quality scores from cw2.mat for 20 participants across 10 views.
 # Contains test images, gold standard images, general impression scores, and criteria percentage scores.
+#
+# cw2.mat is loaded lazily: each variable is read (with loadmat's variable_names)
+# the first time it is accessed, so `from dataloader import gen_impr` reads only
+# gen_impr. The images can also be converted once into a per-view .npy store that
+# is memory-mapped, so image readers only page in the views and participants they use.
 
-import math
-import pandas as pd
-import matplotlib.pyplot as plt
+import os
+import numpy as np
 import scipy.io as sio
 
-# Load cw2.mat
-cw2_data = sio.loadmat('CW2/Provided/cw2.mat')
-# Extract arrays
-test_img = cw2_data['test_img']
-gold_img = cw2_data['gold_img']
-gen_impr = cw2_data['gen_impr']
-crit_perc = cw2_data['crit_perc']
+MAT_PATH = 'CW2/Provided/cw2.mat'
+STORE_DIR = 'CW2/Provided/image_store'
+STORE_INDEX_KEYS = ('present', 'valid', 'groups')  # required entries of an image store index
 
 # GLOBAL VARIABLES
 NUM_PARTICIPANTS = 20
@@ -22,14 +22,282 @@ EXPERT_RANGE = (0, 7)
 NOVICE_RANGE = (7, 20)
 MISSING = [(8,9), (12,7), (13,9), (14,0), (15,3)]
 
+
+class CW2Dataset:
+    """
+    Lazy view of cw2.mat. Each variable in VARIABLES is loaded on first access
+    (dataset.gen_impr, dataset.test_img, ...) and cached.
+    """
+
+    VARIABLES = ('test_img', 'gold_img', 'gen_impr', 'crit_perc')
+
+    def __init__(self, path=MAT_PATH):
+        self.path = path
+        self._cache = {}
+        self._valid = None
+        self._tensor = None
+
+    def load(self, *names):
+        """Load the given variables (only those not already cached) and return them."""
+        missing = [name for name in names if name not in self._cache]
+        if missing:
+            data = sio.loadmat(self.path, variable_names=missing)
+            for name in missing:
+                self._cache[name] = data[name]
+        return [self._cache[name] for name in names]
+
+    def __getattr__(self, name):
+        if name in CW2Dataset.VARIABLES:
+            return self.load(name)[0]
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    def validity(self):
+        """
+        (participants, views) bool validity bitmap, computed once and cached.
+        An entry is invalid if either score is the -1 sentinel or NaN, or it is listed in MISSING.
+        """
+        if self._valid is None:
+            gen_impr, crit_perc = self.load('gen_impr', 'crit_perc')
+            valid = ((gen_impr != -1) & (crit_perc != -1)
+                     & ~np.isnan(gen_impr) & ~np.isnan(crit_perc))
+            if MISSING:
+                rows, cols = zip(*MISSING)
+                valid[list(rows), list(cols)] = False
+            self._valid = valid
+        return self._valid
+
+    def valid_scores(self):
+        """gen_impr and crit_perc (participants x views) as masked arrays, masked where invalid."""
+        gen_impr, crit_perc = self.load('gen_impr', 'crit_perc')
+        invalid = ~self.validity()
+        return np.ma.masked_array(gen_impr, invalid), np.ma.masked_array(crit_perc, invalid)
+
+    def image_tensor(self):
+        """
+        Pack all images into contiguous arrays in their native dtype (computed once and cached).
+
+        Returns:
+            test:   (participants, views, H, W) test images; views smaller than the largest
+                    view are zero-padded at the bottom/right, missing images are all zeros
+            gold:   (views, H, W) gold standard images, padded the same way
+            valid:  (participants, views) bool, validity() further restricted to
+                    entries whose test image is present
+            shapes: (views, 2) int, the unpadded (H, W) of each view; crop with
+                    test[:, v, :shapes[v, 0], :shapes[v, 1]]
+        """
+        if self._tensor is None:
+            self._tensor = self.pack_images()
+        return self._tensor
+
+    def pack_images(self, allocate=None):
+        """
+        Pack the images as image_tensor() does, without caching the result.
+        allocate(key, shape, dtype) returns the zero-filled array to pack each of
+        'test', 'gold', 'valid' and 'shapes' into (default np.zeros), so callers can
+        pack straight into their own buffers (e.g. shared memory blocks).
+
+        Returns:
+            (test, gold, valid, shapes) as in image_tensor()
+        """
+        if allocate is None:
+            def allocate(key, shape, dtype):
+                return np.zeros(shape, dtype=dtype)
+        test_img, gold_img = self.load('test_img', 'gold_img')
+        num_participants, num_views = test_img.shape
+        golds = [np.squeeze(gold_img[0][v]) for v in range(num_views)]
+        images = [[np.squeeze(test_img[p][v]) for v in range(num_views)] for p in range(num_participants)]
+        shapes = allocate('shapes', (num_views, 2), np.int64)
+        shapes[...] = [g.shape for g in golds]
+        height, width = shapes.max(axis=0)
+
+        # One dtype that holds every gold and present test image (missing images are
+        # empty arrays in cw2.mat and do not take part)
+        dtype = np.result_type(*{image.dtype for row in images for v, image in enumerate(row)
+                                 if image.shape == golds[v].shape} | {g.dtype for g in golds})
+        gold = allocate('gold', (num_views, height, width), dtype)
+        test = allocate('test', (num_participants, num_views, height, width), dtype)
+        valid = allocate('valid', (num_participants, num_views), bool)
+        valid[...] = self.validity()
+        for v, (h, w) in enumerate(shapes):
+            gold[v, :h, :w] = golds[v]
+            for p in range(num_participants):
+                image = images[p][v]
+                if image.shape != (h, w):
+                    valid[p, v] = False
+                elif valid[p, v]:
+                    test[p, v, :h, :w] = image
+        return test, gold, valid, shapes
+
+    def convert_to_store(self, store_dir=STORE_DIR, labels=None):
+        """
+        One-time conversion of the images into a per-view on-disk store:
+            view_XX.npy  (participants, H, W) test images of view XX (zeros where missing)
+            gold.npy     (views, H, W) gold standard images (if all views share one size,
+                         otherwise gold_XX.npy per view)
+            index.npz    present: (participants, views) bool, True where a test image exists
+                         valid:   (participants, views) bool, present and validity()
+                         groups:  (participants,) group label of each participant
+                         gen_impr, crit_perc: (participants, views) scores
+
+        labels: optional (participants,) group label of each participant (e.g. an
+                external label column); by default the labels come from the fixed
+                EXPERT_RANGE / NOVICE_RANGE of cw2.mat (see group_labels).
+        Returns the opened ImageStore.
+        """
+        test_img, gold_img, gen_impr, crit_perc = self.load('test_img', 'gold_img', 'gen_impr', 'crit_perc')
+        num_participants, num_views = test_img.shape
+        groups = group_labels(num_participants) if labels is None else _check_labels(labels, num_participants)
+        os.makedirs(store_dir, exist_ok=True)
+
+        present = np.zeros((num_participants, num_views), dtype=bool)
+        golds = []
+        for v in range(num_views):
+            gold = np.squeeze(gold_img[0][v])
+            golds.append(gold)
+            images = [np.squeeze(test_img[p][v]) for p in range(num_participants)]
+            # Missing images are stored in cw2.mat as empty arrays; the view's stack
+            # takes the dtype that holds the gold and every present test image
+            dtype = np.result_type(gold.dtype, *{image.dtype for image in images if image.shape == gold.shape})
+            stack = np.lib.format.open_memmap(os.path.join(store_dir, f'view_{v:02d}.npy'), mode='w+',
+                                              dtype=dtype, shape=(num_participants,) + gold.shape)
+            for p, image in enumerate(images):
+                if image.shape == gold.shape:
+                    stack[p] = image
+                    present[p, v] = True
+                else:
+                    stack[p] = 0
+            stack.flush()
+            del stack
+
+        if len({gold.shape for gold in golds}) == 1:
+            np.save(os.path.join(store_dir, 'gold.npy'), np.stack(golds))
+        else:
+            for v, gold in enumerate(golds):
+                np.save(os.path.join(store_dir, f'gold_{v:02d}.npy'), gold)
+        np.savez(os.path.join(store_dir, 'index.npz'), present=present,
+                 valid=present & self.validity(), groups=groups,
+                 gen_impr=gen_impr, crit_perc=crit_perc)
+        return ImageStore(store_dir)
+
+    def open_store(self, store_dir=STORE_DIR, labels=None):
+        """
+        Open the on-disk image store, converting cw2.mat into it on first use or
+        when its index predates the validity / group entries (STORE_INDEX_KEYS).
+        labels: optional group label of each participant (see convert_to_store);
+                replaces the group labels of an existing store.
+        """
+        index_path = os.path.join(store_dir, 'index.npz')
+        if not os.path.exists(index_path):
+            return self.convert_to_store(store_dir, labels)
+        with np.load(index_path) as index:
+            entries = {name: index[name] for name in index.files}
+        if any(key not in entries for key in STORE_INDEX_KEYS):
+            return self.convert_to_store(store_dir, labels)
+        if labels is not None:
+            groups = _check_labels(labels, entries['present'].shape[0])
+            if not np.array_equal(groups, entries['groups']):
+                entries['groups'] = groups
+                np.savez(index_path, **entries)
+        return ImageStore(store_dir)
+
+
+class ImageStore:
+    """
+    Memory-mapped per-view image store written by CW2Dataset.convert_to_store.
+    View files are opened on first use; indexing a view only pages in the
+    participants that are read. Sizes, validity, group labels and scores are
+    read from the store's index, so the store is not tied to the 20x10 layout.
+    """
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        with np.load(os.path.join(store_dir, 'index.npz')) as index:
+            missing = [key for key in STORE_INDEX_KEYS if key not in index]
+            if missing:
+                raise ValueError(f"Image store {store_dir!r} has no {missing} in its index; "
+                                 f"rebuild it with CW2Dataset.convert_to_store (or open it with open_store)")
+            self.present = index['present']
+            self.valid = index['valid']
+            self.groups = index['groups']
+            self.scores = {name: index[name] for name in ('gen_impr', 'crit_perc') if name in index}
+        self.num_participants, self.num_views = self.present.shape
+        self._views = {}
+        self._gold = None
+
+    def view(self, v):
+        """(participants, H, W) memory-mapped test images of view v."""
+        if v not in self._views:
+            self._views[v] = np.load(os.path.join(self.store_dir, f'view_{v:02d}.npy'), mmap_mode='r')
+        return self._views[v]
+
+    def test(self, p, v):
+        """Test image of participant p, view v (None if missing)."""
+        return self.view(v)[p] if self.present[p, v] else None
+
+    def gold(self, v):
+        """Gold standard image of view v."""
+        stacked = os.path.join(self.store_dir, 'gold.npy')
+        if os.path.exists(stacked):
+            if self._gold is None:
+                self._gold = np.load(stacked, mmap_mode='r')
+            return self._gold[v]
+        return np.load(os.path.join(self.store_dir, f'gold_{v:02d}.npy'), mmap_mode='r')
+
+
+def group_labels(num_participants=NUM_PARTICIPANTS):
+    """
+    Group label ('expert' / 'novice') of each participant, from the hard-coded
+    EXPERT_RANGE and NOVICE_RANGE of cw2.mat. Participants outside both ranges
+    get ''; cohorts with other layouts should pass their own labels instead.
+    """
+    labels = np.full(num_participants, '', dtype='<U6')
+    labels[EXPERT_RANGE[0]:EXPERT_RANGE[1]] = 'expert'
+    labels[NOVICE_RANGE[0]:NOVICE_RANGE[1]] = 'novice'
+    return labels
+
+
+def _check_labels(labels, num_participants):
+    """Group labels as a string array, checked to have one label per participant."""
+    labels = np.asarray(labels, dtype=str)
+    if labels.shape != (num_participants,):
+        raise ValueError(f"Expected {num_participants} group labels, got shape {labels.shape}")
+    return labels
+
+
+dataset = CW2Dataset()
+
+
+def __getattr__(name):
+    # Module-level lazy access: test_img, gold_img, gen_impr and crit_perc are
+    # loaded from cw2.mat on first import/access.
+    if name in CW2Dataset.VARIABLES:
+        return getattr(dataset, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def validity_mask():
+    """(participants, views) bool mask of valid entries (see CW2Dataset.validity)."""
+    return dataset.validity()
+
+
+def get_valid_score_arrays():
+    """
+    Return (gen_impr, crit_perc) for all views at once as (participants, views)
+    masked arrays, masked where the entry is invalid.
+    """
+    return dataset.valid_scores()
+
+
+def mask_invalid(metric_vals):
+    """Mask a (participants, views) metric grid where the entry is invalid or the metric is NaN."""
+    metric_vals = np.asarray(metric_vals)
+    return np.ma.masked_array(metric_vals, ~validity_mask() | np.isnan(metric_vals))
+
+
 def get_valid_scores(view_idx):
     """
     Return (gen_impr_list, crit_perc_list) for a view, excluding missing entries.
     """
-    gi_scores = []
-    cp_scores = []
-    for participant in range(NUM_PARTICIPANTS):
-        if gen_impr[participant][view_idx] != -1:
-            gi_scores.append(gen_impr[participant][view_idx])
-            cp_scores.append(crit_perc[participant][view_idx])
-    return gi_scores, cp_scores
\ No newline at end of file
+    gen_impr, crit_perc = dataset.load('gen_impr', 'crit_perc')
+    valid = validity_mask()[:, view_idx]
+    return list(gen_impr[valid, view_idx]), list(crit_perc[valid, view_idx])
@@ -0,0 +1,133 @@
+# Lazy registry of the CW2 similarity metrics.
+# Each metric declares the per-view inputs it needs; inputs are either the base
+# inputs of a view ('tests': the (N, H, W) stack of valid test images, 'template':
+# the view's GoldTemplate) or registered shared intermediates (e.g. 'sums', the
+# fused intensity reductions behind CS / NCC / MSE / PSNR). A SimilarityMetrics
+# object evaluates requested metrics on first access and memoizes their grids;
+# within a view, every intermediate is computed once and only if a requested
+# metric needs it.
+
+import numpy as np
+from dataloader import dataset as default_dataset
+from similarity import TemplateCache, batched_ssim, mutual_info_batch, intensity_sums, intensity_metrics
+
+BASE_INPUTS = ('tests', 'template')
+
+# name -> (required inputs, function(*inputs))
+INTERMEDIATES = {}
+METRICS = {}
+
+
+def intermediate(name, requires):
+    """Register a shared per-view intermediate computed from the given inputs."""
+    def register(func):
+        INTERMEDIATES[name] = (tuple(requires), func)
+        return func
+    return register
+
+
+def metric(name, requires):
+    """Register a metric computed per view from the given inputs; returns one value per valid participant."""
+    def register(func):
+        METRICS[name] = (tuple(requires), func)
+        return func
+    return register
+
+
+@intermediate('sums', requires=('template', 'tests'))
+def _sums(template, tests):
+    return intensity_sums(template, tests, dtype=np.float64)
+
+
+@metric('ssi', requires=('template', 'tests'))
+def _ssi(template, tests):
+    return batched_ssim(template, tests)
+
+
+@metric('mi', requires=('template', 'tests'))
+def _mi(template, tests):
+    return mutual_info_batch(template, tests)
+
+
+def _register_intensity(name):
+    @metric(name, requires=('sums',))
+    def _intensity(sums):
+        return intensity_metrics(sums, (name,))[name]
+
+
+for _name in ('cs', 'ncc', 'mse', 'psnr'):
+    _register_intensity(_name)
+
+
+class ViewInputs:
+    """Inputs of one block of test images of a view, each resolved on first request and memoized."""
+
+    def __init__(self, tests, template):
+        self._values = {'tests': tests, 'template': template}
+
+    def get(self, name):
+        if name not in self._values:
+            requires, func = INTERMEDIATES[name]
+            self._values[name] = func(*(self.get(dep) for dep in requires))
+        return self._values[name]
+
+
+def check_metrics(names):
+    """Raise ValueError if any of the names is not a registered metric."""
+    unknown = [name for name in names if name not in METRICS]
+    if unknown:
+        raise ValueError(f"Unknown similarity metrics: {unknown} (registered: {sorted(METRICS)})")
+
+
+def evaluate(tests, template, names):
+    """
+    Requested metrics of an (N, H, W) stack of test images of one view against its
+    gold template, sharing the intermediates. Returns a dict metric name -> (N,) values.
+    """
+    inputs = ViewInputs(tests, template)
+    values = {}
+    for name in names:
+        requires, func = METRICS[name]
+        values[name] = func(*(inputs.get(dep) for dep in requires))
+    return values
+
+
+def evaluate_view(test_stack, shapes, templates, rows, v, names):
+    """Requested metrics of the given participant rows of view v of a packed image tensor (see evaluate)."""
+    h, w = shapes[v]
+    return evaluate(test_stack[rows, v, :h, :w], templates[v], names)
+
+
+class SimilarityMetrics:
+    """
+    Lazily evaluated, memoized (participants, views) similarity metric grids
+    (NaN for invalid entries). metrics['ssi'] or metrics.get('ssi', 'cs')
+    compute only the requested metrics that are not cached yet, in one pass
+    over the views so they share intermediates.
+    """
+
+    def __init__(self, dataset=default_dataset):
+        self.dataset = dataset
+        self._grids = {}
+        self._templates = None
+
+    def __getitem__(self, name):
+        return self.get(name)[0]
+
+    def get(self, *names):
+        check_metrics(names)
+        missing = [name for name in dict.fromkeys(names) if name not in self._grids]
+        if missing:
+            self._evaluate(missing)
+        return [self._grids[name] for name in names]
+
+    def _evaluate(self, names):
+        test_stack, gold_stack, valid, shapes = self.dataset.image_tensor()
+        if self._templates is None:
+            self._templates = TemplateCache([gold_stack[v, :h, :w] for v, (h, w) in enumerate(shapes)])
+        grids = {name: np.full(valid.shape, np.nan) for name in names}
+        for v in range(valid.shape[1]):
+            rows = np.flatnonzero(valid[:, v])
+            for name, values in evaluate_view(test_stack, shapes, self._templates, rows, v, names).items():
+                grids[name][rows, v] = values
+        self._grids.update(grids)
@@ -1,6 +1,7 @@
-from dataloader import gen_impr, crit_perc, NUM_PARTICIPANTS, NUM_VIEWS, EXPERT_RANGE, NOVICE_RANGE, MISSING, get_valid_scores
+from dataloader import gen_impr, crit_perc, NUM_VIEWS, validity_mask
+from score_stats import load_scores
+from regression_diagnostics import loo_diagnostics
 from plot_style import apply_style, scatter_points, reference_line, finish_figure, BLUE, GREEN, GREY, RED
-from scipy import stats
 import numpy as np
 import matplotlib.pyplot as plt
 import os
@@ -10,49 +11,6 @@ os.makedirs("figures", exist_ok=True)
 VIEW_NAMES = [f"View {i+1}" for i in range(NUM_VIEWS)]
 
 
-def calculate_pearson(view_idx):
-    """
-    Calculate Pearson correlation coefficient between general impression
-    and criteria percentage scores for a given view.
-
-    Pearson's r measures the linear relationship between two variables:
-
-        r = Σ((xi - x̄)(yi - ȳ)) / sqrt(Σ(xi - x̄)² * Σ(yi - ȳ)²)
-
-    where:
-        xi, yi = individual score pairs
-        x̄, ȳ  = mean of each score set
-
-    r ranges from -1 (perfect negative) to +1 (perfect positive).
-    A higher |r| indicates stronger linear agreement between the two scores.
-
-    Args:
-        view_idx: Index of the view (0-9)
-
-    Returns:
-        r: Pearson correlation coefficient
-        p_value: Two-tailed p-value for testing non-correlation
-    """
-    gi, cp = get_valid_scores(view_idx)
-    r, p_value = stats.pearsonr(gi, cp)
-    return r, p_value
-
-def linear_regression(view_idx):
-    """
-    Perform linear regression: gen_impr (independent) → crit_perc (dependent).
-    Returns slope, intercept, predicted values, RMSE, R².
-    """
-    gi, cp = get_valid_scores(view_idx)
-    slope, intercept, r_value, p_value, std_err = stats.linregress(gi, cp)
-    gi = np.array(gi)
-    cp = np.array(cp)
-    predicted = slope * gi + intercept
-    rmse = np.sqrt(np.mean((predicted - cp) ** 2))
-    r_squared = r_value ** 2
-    return slope, intercept, predicted, rmse, r_squared
-
-
-
 def plot_true_vs_estimated(view_idx, cp, predicted, rmse, r_squared):
     """
     Plot true criteria percentage vs estimated criteria percentage for a given view.
@@ -104,37 +62,45 @@ def plot_true_vs_estimated(view_idx, cp, predicted, rmse, r_squared):
 
 if __name__ == "__main__":
 
+    # Pearson correlation and regression for all views from the persisted per-view
+    # sufficient statistics (participants added to cw2.mat since the last run are ingested)
+    valid = validity_mask()
+    fits = load_scores().fit()
+    # Closed-form leave-one-out diagnostics of the same fits
+    diagnostics = loo_diagnostics(gen_impr, crit_perc, valid)
+
     # Part i: Pearson Correlation.
     print("PART i: Pearson Correlation Coefficient")
     print(f"{'View':<10} {'Pearson r':<12} {'p-value':<12}")
 
-    pearson_results = []
-    for v in range(NUM_VIEWS):
-        r, p = calculate_pearson(v)
-        pearson_results.append((v, r, p))
-        print(f"{VIEW_NAMES[v]:<10} {r:<12.4f} {p:<12.6f}")
+    for fit in fits:
+        print(f"{VIEW_NAMES[fit['view']]:<10} {fit['r']:<12.4f} {fit['p_value']:<12.6f}")
 
     # Identify the view with the highest |r| (strongest linear agreement)
-    best_view = max(pearson_results, key=lambda x: abs(x[1]))
-    print(f"\nHighest agreement: {VIEW_NAMES[best_view[0]]} (r = {best_view[1]:.4f})")
+    best_view = fits[np.argmax(np.abs(fits['r']))]
+    print(f"\nHighest agreement: {VIEW_NAMES[best_view['view']]} (r = {best_view['r']:.4f})")
 
     # Part ii: Linear Regression.
     print("\nPART ii: Linear Regression (gen_impr -> crit_perc)")
-    print(f"{'View':<10} {'Slope':<10} {'Intercept':<12} {'RMSE':<10} {'R²':<10}")
+    print(f"{'View':<10} {'Slope':<10} {'Intercept':<12} {'RMSE':<10} {'R²':<10} "
+          f"{'LOO RMSE':<10} {'Pred R²':<10} {'Max Cook':<10}")
 
-    regression_results = []
-    for v in range(NUM_VIEWS):
-        slope, intercept, predicted, rmse, r_sq = linear_regression(v)
-        gi, cp = get_valid_scores(v)
-        cp = np.array(cp)
-        regression_results.append((v, slope, intercept, predicted, cp, rmse, r_sq))
-        print(f"{VIEW_NAMES[v]:<10} {slope:<10.4f} {intercept:<12.4f} {rmse:<10.4f} {r_sq:<10.4f}")
+    for fit in fits:
+        v = fit['view']
+        print(f"{VIEW_NAMES[v]:<10} {fit['slope']:<10.4f} {fit['intercept']:<12.4f} "
+              f"{fit['rmse']:<10.4f} {fit['r_squared']:<10.4f} "
+              f"{diagnostics['loo_rmse'][v]:<10.4f} {diagnostics['predicted_r2'][v]:<10.4f} "
+              f"{np.nanmax(diagnostics['cooks_d'][:, v]):<10.4f}")
 
     # Part iii: Plot 3 best performing views.
     print("\nPART iii: True vs Estimated Plots (3 best views by R²)")
 
     # Rank by R² (highest = best fit) and select top 3
-    ranked = sorted(regression_results, key=lambda x: x[6], reverse=True)
-    for v, slope, intercept, predicted, cp, rmse, r_sq in ranked[:3]:
-        print(f"Plotting {VIEW_NAMES[v]} (R² = {r_sq:.4f})")
-        plot_true_vs_estimated(v, cp, predicted, rmse, r_sq)
+    ranked = fits[np.argsort(fits['r_squared'], kind='stable')[::-1]]
+    for fit in ranked[:3]:
+        v = fit['view']
+        gi = gen_impr[valid[:, v], v]
+        cp = crit_perc[valid[:, v], v]
+        predicted = fit['slope'] * gi + fit['intercept']
+        print(f"Plotting {VIEW_NAMES[v]} (R² = {fit['r_squared']:.4f})")
+        plot_true_vs_estimated(v, cp, predicted, fit['rmse'], fit['r_squared'])
@@ -2,67 +2,182 @@
 # Computes SSI, MI, and CS between test images and gold standards,
 # identifies top participants per view, and performs expert vs novice statistical testing.
 
-from dataloader import (test_img, gold_img, NUM_PARTICIPANTS, NUM_VIEWS,
-                        EXPERT_RANGE, NOVICE_RANGE, MISSING)
-from skimage.metrics import structural_similarity as ssim
-from sklearn.metrics import mutual_info_score
+from dataloader import dataset, ImageStore
+from cohort import Cohort, CHUNK_PARTICIPANTS
+from similarity import TemplateCache
+from metric_registry import check_metrics, evaluate, evaluate_view
+from shared_dataset import SharedDataset, init_worker, worker_arrays
+from concurrent.futures import ProcessPoolExecutor
 from scipy import stats
 import numpy as np
+import os
 
-VIEW_NAMES = [f"View {i+1}" for i in range(NUM_VIEWS)]
+SIMILARITY_METRICS = ('ssi', 'mi', 'cs')
+INTENSITY_EXTRA = ('ncc', 'mse', 'psnr')
+TASKS_PER_WORKER = 4  # (view, participant-chunk) tasks per worker in parallel mode
 
 
-def is_missing(p, v):
-    """Check if participant p, view v is a missing data entry."""
-    return (p, v) in MISSING
-
-
-def compute_similarity_metrics():
+def compute_similarity_metrics(intensity=False, workers=1, metrics=None, cohort=None, chunk=CHUNK_PARTICIPANTS):
     """
     Compute SSI, MI, and CS for each test image against its gold standard.
 
     SSI (Structural Similarity Index): Compares luminance, contrast, and structure
-        between two images. Computed via skimage.metrics.structural_similarity.
+        between two images. Same result as skimage.metrics.structural_similarity,
+        computed for all participants of a view at once (similarity.batched_ssim)
+        reusing the gold image's cached local mean and variance.
 
     MI (Mutual Information): Entropy-based metric measuring shared information
         between two images. MI = E_a + E_b - E_ab.
-        Computed via sklearn.metrics.mutual_info_score on flattened pixel arrays.
+        Computed from the joint histogram of integer pixel values (one bincount per
+        block of participants, gold marginal cached per view); equal to
+        sklearn.metrics.mutual_info_score on the flattened pixel arrays.
 
     CS (Cosine Similarity): Measures the cosine of the angle between two image
         vectors (flattened). CS = dot(a, b) / (||a|| * ||b||).
 
+    CS is derived from the fused per-image reductions Σa, Σb, Σa², Σb², Σab
+    (similarity.intensity_sums), which also give NCC, MSE and PSNR at no extra cost.
+
+    Every metric is evaluated through the metric registry (metric_registry.METRICS),
+    so only the requested metrics and the intermediates they need are computed.
+
+    With a cohort (cohort.Cohort over the on-disk image store), the test images are
+    streamed from the memory-mapped view files in (participant-chunk, view) blocks,
+    so memory is bounded by the chunk size rather than the number of participants;
+    sizes and validity come from the store. Without one, the packed in-memory image
+    tensor of the dataset is used.
+
+    Cells are independent, so the grid can be split into view-major tasks of
+    participant chunks and run on a process pool (workers > 1). With a cohort, each
+    worker opens the memory-mapped store itself; otherwise the image tensor is placed
+    in shared memory once and attached zero-copy by every worker. Each worker keeps
+    its own gold template cache, so consecutive chunks of the same view reuse it.
+    Results are written into the preallocated grids by (participant, view) index, so
+    they are identical to the serial run whatever the completion order.
+
+    Args:
+        intensity: if True, also return the NCC, MSE and PSNR grids
+        workers: number of worker processes (1 = serial in this process,
+                 None = one per CPU)
+        metrics: optional subset of registered metric names to compute instead;
+                 the grids are then returned as a dict name -> (participants, views) array
+        cohort: optional Cohort to stream the images from (see above)
+        chunk: participants per block in cohort mode
+
+    Returns:
+        ssi_vals, mi_vals, cs_vals: each a (participants, views) numpy array (NaN for missing entries)
+        intensity_vals (only if intensity=True): dict 'ncc' / 'mse' / 'psnr' -> (participants, views) array
+    """
+    if metrics is not None:
+        names = tuple(dict.fromkeys(metrics))
+        check_metrics(names)
+    else:
+        names = SIMILARITY_METRICS + (INTENSITY_EXTRA if intensity else ())
+
+    if cohort is not None:
+        grids = {name: np.full((cohort.num_participants, cohort.num_views), np.nan) for name in names}
+        if workers == 1:
+            # Per-view gold standard statistics, computed once per view from the store
+            templates = TemplateCache([cohort.store.gold(v) for v in range(cohort.num_views)])
+            for p0, p1, v, images, gold, valid in cohort.blocks(chunk):
+                rows = np.flatnonzero(valid)
+                if rows.size:
+                    for name, values in evaluate(images[rows], templates[v], names).items():
+                        grids[name][p0 + rows, v] = values
+        else:
+            tasks = [(v, p0, p1, names) for p0, p1, v in cohort.block_ranges(chunk)]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_store_worker,
+                                     initargs=(cohort.store.store_dir,)) as pool:
+                for (v, _, _, _), (rows, values) in zip(tasks, pool.map(_store_similarity_task, tasks)):
+                    for name in names:
+                        grids[name][rows, v] = values[name]
+        return _similarity_results(grids, intensity, metrics)
+
+    # All test images packed as one (participants, views, H, W) array, with the validity mask
+    test_stack, gold_stack, valid, shapes = dataset.image_tensor()
+    num_participants, num_views = valid.shape
+    grids = {name: np.full((num_participants, num_views), np.nan) for name in names}
+
+    if workers == 1:
+        # Per-view gold standard statistics, computed once and shared by all participants
+        templates = TemplateCache([gold_stack[v, :h, :w] for v, (h, w) in enumerate(shapes)])
+        for v in range(num_views):
+            rows, values = view_similarity(test_stack, valid, shapes, templates, v, 0, num_participants, names)
+            for name in names:
+                grids[name][rows, v] = values[name]
+    else:
+        n_workers = workers or os.cpu_count() or 1
+        # View-major tasks: (view, first participant, end participant)
+        chunk = -(-num_participants * num_views // (n_workers * TASKS_PER_WORKER))
+        chunk = min(max(chunk, 1), num_participants)
+        tasks = [(v, p0, min(p0 + chunk, num_participants), names)
+                 for v in range(num_views) for p0 in range(0, num_participants, chunk)]
+        with SharedDataset.from_dataset(dataset) as shared:
+            with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_similarity_worker,
+                                     initargs=(shared.descriptors,)) as pool:
+                for (v, _, _, _), (rows, values) in zip(tasks, pool.map(_similarity_task, tasks)):
+                    for name in names:
+                        grids[name][rows, v] = values[name]
+    return _similarity_results(grids, intensity, metrics)
+
+
+def _similarity_results(grids, intensity, metrics):
+    # Grids in the return layout of compute_similarity_metrics
+    if metrics is not None:
+        return grids
+    ssi_vals, mi_vals, cs_vals = (grids[name] for name in SIMILARITY_METRICS)
+    if intensity:
+        return ssi_vals, mi_vals, cs_vals, {name: grids[name] for name in INTENSITY_EXTRA}
+    return ssi_vals, mi_vals, cs_vals
+
+
+def view_similarity(test_stack, valid, shapes, templates, v, p0, p1, names=SIMILARITY_METRICS):
+    """
+    Similarity metrics of the valid participants p0..p1-1 of view v, evaluated
+    through the metric registry (shared intermediates computed once per call).
+
     Returns:
-        ssi_vals, mi_vals, cs_vals: each a 20x10 numpy array (NaN for missing entries)
+        rows: participant indices of the valid entries
+        values: dict metric name -> values for those rows
     """
-    ssi_vals = np.full((NUM_PARTICIPANTS, NUM_VIEWS), np.nan)
-    mi_vals = np.full((NUM_PARTICIPANTS, NUM_VIEWS), np.nan)
-    cs_vals = np.full((NUM_PARTICIPANTS, NUM_VIEWS), np.nan)
+    rows = p0 + np.flatnonzero(valid[p0:p1, v])
+    return rows, evaluate_view(test_stack, shapes, templates, rows, v, names)
 
-    for v in range(NUM_VIEWS):
-        # Gold standard image for this view (squeeze to 2D if needed - Just to remove any additional dimensions (If applicable))
-        gold = np.squeeze(gold_img[0][v]).astype(np.float64)
 
-        for p in range(NUM_PARTICIPANTS):
-            if is_missing(p, v):
-                continue
+# Per-worker gold template cache, built from the shared gold images
+_WORKER_TEMPLATES = None
 
-            # Test image for this participant and view
-            test = np.squeeze(test_img[p][v]).astype(np.float64)
 
-            # SSI: structural similarity using full image data range
-            data_range = max(gold.max(), test.max()) - min(gold.min(), test.min())
-            ssi_vals[p][v] = ssim(gold, test, data_range=data_range)
+def _init_similarity_worker(descriptors):
+    global _WORKER_TEMPLATES
+    init_worker(descriptors)
+    arrays = worker_arrays()
+    _WORKER_TEMPLATES = TemplateCache([arrays['gold'][v, :h, :w] for v, (h, w) in enumerate(arrays['shapes'])])
 
-            # MI: mutual information from flattened pixel intensity arrays
-            mi_vals[p][v] = mutual_info_score(gold.flatten().astype(int),
-                                              test.flatten().astype(int))
 
-            # CS: cosine similarity between flattened image vectors
-            a = test.flatten()
-            b = gold.flatten()
-            cs_vals[p][v] = np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+def _similarity_task(task):
+    v, p0, p1, names = task
+    arrays = worker_arrays()
+    return view_similarity(arrays['test'], arrays['valid'], arrays['shapes'], _WORKER_TEMPLATES,
+                           v, p0, p1, names)
+
+
+# Per-worker image store (memory-mapped) for cohort mode
+_WORKER_STORE = None
 
-    return ssi_vals, mi_vals, cs_vals
+
+def _init_store_worker(store_dir):
+    global _WORKER_STORE, _WORKER_TEMPLATES
+    _WORKER_STORE = ImageStore(store_dir)
+    _WORKER_TEMPLATES = TemplateCache([_WORKER_STORE.gold(v) for v in range(_WORKER_STORE.num_views)])
+
+
+def _store_similarity_task(task):
+    v, p0, p1, names = task
+    rows = p0 + np.flatnonzero(_WORKER_STORE.valid[p0:p1, v])
+    if not rows.size:
+        return rows, {name: np.empty(0) for name in names}
+    return rows, evaluate(_WORKER_STORE.view(v)[rows], _WORKER_TEMPLATES[v], names)
 
 
 def get_top3_participants(metric_vals, view_idx):
@@ -77,32 +192,42 @@ def get_top3_participants(metric_vals, view_idx):
     return ranked[:3]
 
 
-def get_group_values(metric_vals, view_idx, group_range):
+def compare_groups(cohort, m_name, m_vals, view_names):
     """
-    Extract valid (non-NaN) metric values for a participant group in a given view.
+    Two-sided Mann-Whitney U test of expert vs novice values of one metric for
+    every view, printed as one table. Returns the number of views with p < 0.05.
+    """
+    print(f"\n{m_name}")
+    print(f"{'View':<10} {'Expert mean':<14} {'Novice mean':<14} {'U-stat':<12} {'p-value':<12} {'Significant?':<12}")
 
-    Args:
-        metric_vals: 20x10 array of metric values
-        view_idx: view index (0-9)
-        group_range: tuple (start, end) for participant indices
+    n_significant = 0
+    for v in range(cohort.num_views):
+        expert_vals = cohort.group_values(m_vals, v, 'expert')
+        novice_vals = cohort.group_values(m_vals, v, 'novice')
 
-    Returns:
-        numpy array of valid metric values for the group
-    """
-    values = []
-    for p in range(group_range[0], group_range[1]):
-        val = metric_vals[p][view_idx]
-        if not np.isnan(val):
-            values.append(val)
-    return np.array(values)
+        # Mann-Whitney U test (two-sided)
+        u_stat, p_value = stats.mannwhitneyu(expert_vals, novice_vals,
+                                              alternative='two-sided')
+        sig = "Yes" if p_value < 0.05 else "No"
+        if p_value < 0.05:
+            n_significant += 1
+
+        print(f"{view_names[v]:<10} {expert_vals.mean():<14.4f} {novice_vals.mean():<14.4f} "
+              f"{u_stat:<12.2f} {p_value:<12.6f} {sig:<12}")
+    return n_significant
 
 
 # Main execution.
 
 if __name__ == "__main__":
 
-    # Compute all similarity metrics.
-    ssi_vals, mi_vals, cs_vals = compute_similarity_metrics()
+    # Participants, views, validity and groups of the on-disk image store; images are
+    # streamed from it in participant chunks (converted from cw2.mat on first use).
+    cohort = Cohort.open()
+    view_names = [f"View {v + 1}" for v in range(cohort.num_views)]
+
+    # Compute all similarity metrics (NCC, MSE and PSNR come from the same fused pass as CS).
+    ssi_vals, mi_vals, cs_vals, intensity_vals = compute_similarity_metrics(intensity=True, cohort=cohort)
 
     # Part i: Report top 3 participants per view per metric.
     print("PART i: Top 3 Participants per View by Similarity Metric")
@@ -113,22 +238,22 @@ if __name__ == "__main__":
     for m_name, m_vals in zip(metric_names, metric_arrays):
         print(f"\n{m_name}")
         print(f"{'View':<10} {'#1':<20} {'#2':<20} {'#3':<20}")
-        for v in range(NUM_VIEWS):
+        for v in range(cohort.num_views):
             top3 = get_top3_participants(m_vals, v)
             # Report as 1-indexed participant numbers with their metric values
             entries = []
             for idx in top3:
                 entries.append(f"P{idx+1} ({m_vals[idx][v]:.4f})")
-            print(f"{VIEW_NAMES[v]:<10} {entries[0]:<20} {entries[1]:<20} {entries[2]:<20}")
+            print(f"{view_names[v]:<10} {entries[0]:<20} {entries[1]:<20} {entries[2]:<20}")
 
     # Print full metric tables for reference.
     for m_name, m_vals in zip(metric_names, metric_arrays):
         print(f"Full {m_name} values per participant per view")
-        header = f"{'Participant':<14}" + "".join([f"{VIEW_NAMES[v]:<10}" for v in range(NUM_VIEWS)])
+        header = f"{'Participant':<14}" + "".join([f"{view_names[v]:<10}" for v in range(cohort.num_views)])
         print(header)
-        for p in range(NUM_PARTICIPANTS):
+        for p in range(cohort.num_participants):
             row = f"{'P' + str(p+1):<14}"
-            for v in range(NUM_VIEWS):
+            for v in range(cohort.num_views):
                 val = m_vals[p][v]
                 row += f"{val:<10.4f}" if not np.isnan(val) else f"{'N/A':<10}"
             print(row)
@@ -140,31 +265,21 @@ if __name__ == "__main__":
     print(f"Significance level: alpha = 0.05\n")
 
     # Track significance counts per metric to determine best differentiator
-    sig_counts = {name: 0 for name in metric_names}
-
-    for m_name, m_vals in zip(metric_names, metric_arrays):
-        print(f"\n{m_name}")
-        print(f"{'View':<10} {'Expert mean':<14} {'Novice mean':<14} {'U-stat':<12} {'p-value':<12} {'Significant?':<12}")
-
-        for v in range(NUM_VIEWS):
-            expert_vals = get_group_values(m_vals, v, EXPERT_RANGE)
-            novice_vals = get_group_values(m_vals, v, NOVICE_RANGE)
-
-            # Mann-Whitney U test (two-sided)
-            u_stat, p_value = stats.mannwhitneyu(expert_vals, novice_vals,
-                                                  alternative='two-sided')
-            sig = "Yes" if p_value < 0.05 else "No"
-            if p_value < 0.05:
-                sig_counts[m_name] += 1
-
-            print(f"{VIEW_NAMES[v]:<10} {expert_vals.mean():<14.4f} {novice_vals.mean():<14.4f} "
-                  f"{u_stat:<12.2f} {p_value:<12.6f} {sig:<12}")
+    sig_counts = {m_name: compare_groups(cohort, m_name, m_vals, view_names)
+                  for m_name, m_vals in zip(metric_names, metric_arrays)}
 
     # Summary: which metric best differentiates expert vs novice
     print("Summary: Number of views with significant differences (p < 0.05)")
     for m_name in metric_names:
-        print(f"  {m_name}: {sig_counts[m_name]} / {NUM_VIEWS} views")
+        print(f"  {m_name}: {sig_counts[m_name]} / {cohort.num_views} views")
 
     best_metric = max(sig_counts, key=sig_counts.get)
     print(f"\nBest differentiating metric: {best_metric} "
-          f"(significant in {sig_counts[best_metric]} / {NUM_VIEWS} views)")
+          f"(significant in {sig_counts[best_metric]} / {cohort.num_views} views)")
+
+    # Supplementary: intensity-based metrics from the fused reductions.
+    print("\nSupplementary: Intensity-based Metrics (NCC, MSE, PSNR) — Expert vs Novice")
+    extra_names = {"ncc": "NCC", "mse": "MSE", "psnr": "PSNR (dB)"}
+
+    for key, m_name in extra_names.items():
+        compare_groups(cohort, m_name, intensity_vals[key], view_names)
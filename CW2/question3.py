@@ -1,5 +1,5 @@
 from dataloader import NUM_VIEWS, MISSING, gen_impr, crit_perc
-from question2 import compute_similarity_metrics
+from metric_registry import SimilarityMetrics
 from plot_style import apply_style, scatter_points, reference_line, finish_figure, BLUE, ORANGE
 from scipy import stats
 from sklearn.preprocessing import PolynomialFeatures
@@ -12,7 +12,17 @@ import os
 apply_style()
 VIEW_NAMES = [f"View {i+1}" for i in range(NUM_VIEWS)]
 
-ssi_vals, mi_vals, cs_vals = compute_similarity_metrics()
+# Similarity metric grids, computed lazily: each metric is only evaluated when first needed
+similarity_metrics = SimilarityMetrics()
+METRIC_GRIDS = {'ssi_vals': 'ssi', 'mi_vals': 'mi', 'cs_vals': 'cs'}
+
+
+def __getattr__(name):
+    # question3.ssi_vals etc. compute (and memoize) only the requested metric
+    if name in METRIC_GRIDS:
+        return similarity_metrics[METRIC_GRIDS[name]]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 def compute_metric_correlations(ssi_vals, mi_vals, cs_vals):
     """
@@ -199,6 +209,9 @@ def gaussian_basis_regression(ssi_vals, gi_vals, max_order=10):
 if __name__ == "__main__":
     os.makedirs("figures", exist_ok=True)
 
+    # All three similarity metrics are needed below: evaluate them in one pass
+    ssi_vals, mi_vals, cs_vals = similarity_metrics.get('ssi', 'mi', 'cs')
+
     # Part i: Correlation between similarity metric pairs.
     print("PART i: Correlation Between Similarity Metrics")
 
@@ -4,7 +4,8 @@
 
 from dataloader import (test_img, gold_img, gen_impr, crit_perc,
                         NUM_PARTICIPANTS, NUM_VIEWS,
-                        EXPERT_RANGE, NOVICE_RANGE, MISSING)
+                        EXPERT_RANGE, NOVICE_RANGE, validity_mask)
+from regression_diagnostics import loo_diagnostics, view_diagnostics
 from plot_style import apply_style, scatter_points, reference_line, finish_figure, BLUE
 from scipy import stats
 import numpy as np
@@ -19,11 +20,6 @@ apply_style()
 VIEW_NAMES = [f"View {i+1}" for i in range(NUM_VIEWS)]
 
 
-def is_missing(p, v):
-    """Check if participant p, view v is a missing data entry."""
-    return (p, v) in MISSING
-
-
 def compute_rigid_transforms():
     """
     Compute rotation (degrees) and translation (pixels) for each test image
@@ -34,11 +30,12 @@ def compute_rigid_transforms():
     """
     rotation_vals = np.full((NUM_PARTICIPANTS, NUM_VIEWS), np.nan)
     translation_vals = np.full((NUM_PARTICIPANTS, NUM_VIEWS), np.nan)
+    valid = validity_mask()
     for v in range(NUM_VIEWS):
 
         gold = np.squeeze(gold_img[0][v]).astype(np.uint8)
         for p in range(NUM_PARTICIPANTS):
-            if is_missing(p, v):
+            if not valid[p, v]:
                 continue
 
             test = np.squeeze(test_img[p][v]).astype(np.uint8)
@@ -69,19 +66,27 @@ def linear_regression_q4(x_vals, y_vals):
         y_vals: 20×10 array of dependent variable (crit_perc or gen_impr)
 
     Returns:
-        list of dicts per view with keys: view, slope, intercept, predicted, y_true, rmse, r2
+        list of dicts per view with keys: view, slope, intercept, predicted, y_true, rmse, r2,
+        and the closed-form leave-one-out diagnostics press, loo_rmse, predicted_r2,
+        hat, loo_residuals, cooks_d (see regression_diagnostics)
     """
+    # Skip NaN in x (missing ECC) and -1 in y (missing scores)
+    valid_all = ~np.isnan(x_vals) & (y_vals != -1)
+    # LOO diagnostics for every view in one vectorized pass (no refitting)
+    diagnostics = loo_diagnostics(x_vals, y_vals, valid_all)
+
     results = []
     for v in range(NUM_VIEWS):
         x = x_vals[:, v]
         y = y_vals[:, v]
-        # Skip NaN in x (missing ECC) and -1 in y (missing scores)
-        valid = ~np.isnan(x) & (y != -1)
+        valid = valid_all[:, v]
         if np.sum(valid) < 2:
             results.append({
                 "view": VIEW_NAMES[v], "slope": np.nan, "intercept": np.nan,
                 "predicted": np.array([]), "y_true": np.array([]),
-                "rmse": np.nan, "r2": np.nan
+                "rmse": np.nan, "r2": np.nan,
+                "press": np.nan, "loo_rmse": np.nan, "predicted_r2": np.nan,
+                "hat": np.array([]), "loo_residuals": np.array([]), "cooks_d": np.array([])
             })
             continue
         x_valid = x[valid]
@@ -93,7 +98,8 @@ def linear_regression_q4(x_vals, y_vals):
         results.append({
             "view": VIEW_NAMES[v], "slope": slope, "intercept": intercept,
             "predicted": predicted, "y_true": y_valid,
-            "rmse": rmse, "r2": r2
+            "rmse": rmse, "r2": r2,
+            **view_diagnostics(diagnostics, v, valid_all)
         })
     return results
 
@@ -194,13 +200,16 @@ if __name__ == "__main__":
         for dep_name, dep_vals in dep_vars:
             combo = f"{indep_name} -> {dep_name}"
             print(f"\n{combo}")
-            print(f"{'View':<10} {'Slope':<10} {'Intercept':<12} {'RMSE':<10} {'R²':<10}")
+            print(f"{'View':<10} {'Slope':<10} {'Intercept':<12} {'RMSE':<10} {'R²':<10} "
+                  f"{'LOO RMSE':<10} {'Pred R²':<10} {'Max Cook':<10}")
 
             results = linear_regression_q4(indep_vals, dep_vals)
 
             for r in results:
+                max_cook = r['cooks_d'].max() if r['cooks_d'].size else np.nan
                 print(f"{r['view']:<10} {r['slope']:<10.4f} {r['intercept']:<12.4f} "
-                      f"{r['rmse']:<10.4f} {r['r2']:<10.4f}")
+                      f"{r['rmse']:<10.4f} {r['r2']:<10.4f} "
+                      f"{r['loo_rmse']:<10.4f} {r['predicted_r2']:<10.4f} {max_cook:<10.4f}")
 
             # Tag each result with its combo name for global ranking
             for r in results:
@@ -0,0 +1,72 @@
+# Closed-form leave-one-out diagnostics for the per-view simple linear regressions.
+# For y = slope * x + intercept fitted on the n valid points of a view, the
+# leave-one-out quantities follow from the hat-matrix diagonal without refitting:
+#   h_i       = 1/n + (x_i - x̄)² / Sxx                 (leverage)
+#   e_i       = y_i - ŷ_i                              (in-sample residual)
+#   e_(i)     = e_i / (1 - h_i)                        (LOO prediction residual)
+#   PRESS     = Σ e_(i)²,  LOO RMSE = sqrt(PRESS / n)
+#   pred. R²  = 1 - PRESS / Syy
+#   Cook's D  = e_i² / (p * s²) * h_i / (1 - h_i)²,  p = 2,  s² = SSE / (n - 2)
+# All views are handled at once on (participants, views) arrays.
+
+import numpy as np
+
+NUM_PARAMS = 2  # slope and intercept
+
+
+def loo_diagnostics(x, y, valid):
+    """
+    LOO diagnostics of the regression of y on x, for every view (column) at once.
+
+    Args:
+        x, y: (participants, views) arrays
+        valid: (participants, views) bool mask of the points used in each view's fit
+
+    Returns:
+        dict with
+            hat, loo_residuals, cooks_d: (participants, views), NaN where not valid
+            press, loo_rmse, predicted_r2: (views,)
+    """
+    valid = np.asarray(valid, dtype=bool)
+    w = valid.astype(np.float64)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+    n = w.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dx = (x - x.sum(axis=0) / n) * w
+        dy = (y - y.sum(axis=0) / n) * w
+        sxx = np.einsum('ij,ij->j', dx, dx)
+        syy = np.einsum('ij,ij->j', dy, dy)
+        slope = np.einsum('ij,ij->j', dx, dy) / sxx
+
+        residuals = dy - slope * dx
+        hat = 1.0 / n + dx * dx / sxx
+        loo_residuals = residuals / (1.0 - hat)
+        press = np.einsum('ij,ij->j', loo_residuals * w, loo_residuals * w)
+        s2 = np.einsum('ij,ij->j', residuals, residuals) / (n - NUM_PARAMS)
+        cooks_d = residuals ** 2 / (NUM_PARAMS * s2) * hat / (1.0 - hat) ** 2
+
+        return {
+            'hat': np.where(valid, hat, np.nan),
+            'loo_residuals': np.where(valid, loo_residuals, np.nan),
+            'cooks_d': np.where(valid, cooks_d, np.nan),
+            'press': press,
+            'loo_rmse': np.sqrt(press / n),
+            'predicted_r2': 1.0 - press / syy,
+        }
+
+
+def view_diagnostics(diagnostics, view_idx, valid):
+    """
+    Diagnostics of one view as a dict of scalars and arrays over that view's valid
+    points (in participant order), ready to merge into a per-view results dict.
+    """
+    rows = np.asarray(valid)[:, view_idx]
+    return {
+        'press': diagnostics['press'][view_idx],
+        'loo_rmse': diagnostics['loo_rmse'][view_idx],
+        'predicted_r2': diagnostics['predicted_r2'][view_idx],
+        'hat': diagnostics['hat'][rows, view_idx],
+        'loo_residuals': diagnostics['loo_residuals'][rows, view_idx],
+        'cooks_d': diagnostics['cooks_d'][rows, view_idx],
+    }
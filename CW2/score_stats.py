@@ -0,0 +1,205 @@
+# Online per-view regression statistics for streaming quality scores.
+# Keeps the sufficient statistics (n, Σx, Σy, Σx², Σy², Σxy) of the score pairs
+# (x = gen_impr, y = crit_perc) of every view. New pairs are added with update(),
+# shards are combined with merge(), and Pearson r, slope, intercept, R² and RMSE
+# are read off the sums in O(1) per view, so the score-agreement report does not
+# need the full score matrix. The state is saved to / loaded from an .npz file,
+# together with the number of participant rows ingested and the modification time
+# of the cw2.mat they came from; load_scores() adds only rows appended since then.
+
+import os
+import numpy as np
+from scipy import stats
+from dataloader import dataset as default_dataset
+
+STATS_PATH = 'CW2/Provided/score_stats.npz'
+MISSING_SCORE = -1  # sentinel of a missing score in cw2.mat
+SUM_FIELDS = ('n', 'sx', 'sy', 'sxx', 'syy', 'sxy')
+
+# Structured per-view regression result: one record per view
+VIEW_FIT_DTYPE = np.dtype([('view', np.int64), ('n', np.int64), ('r', np.float64), ('p_value', np.float64),
+                           ('slope', np.float64), ('intercept', np.float64),
+                           ('rmse', np.float64), ('r_squared', np.float64)])
+
+
+class ScoreAccumulator:
+    """
+    Per-view sufficient statistics of (x, y) score pairs, each a (views,) float64 array:
+        n = number of pairs, sx = Σx, sy = Σy, sxx = Σx², syy = Σy², sxy = Σxy
+    rows: number of participant rows added with update()
+    source_mtime_ns: modification time of the score file the sums were built from (or None)
+    """
+
+    def __init__(self, num_views):
+        self.num_views = num_views
+        self.rows = 0
+        self.source_mtime_ns = None
+        for field in SUM_FIELDS:
+            setattr(self, field, np.zeros(num_views, dtype=np.float64))
+
+    @classmethod
+    def from_scores(cls, x, y, valid):
+        """Accumulator of the valid entries of (participants, views) score matrices."""
+        acc = cls(np.shape(x)[1])
+        acc.update(x, y, valid)
+        return acc
+
+    def update(self, x, y, valid=None):
+        """
+        Add new participants' scores: x, y are (k, views) arrays, one row per participant.
+        Entries where valid is False, or x or y is NaN or MISSING_SCORE, are skipped.
+        """
+        x = np.atleast_2d(np.asarray(x, dtype=np.float64))
+        y = np.atleast_2d(np.asarray(y, dtype=np.float64))
+        keep = _observed(x, y)
+        if valid is not None:
+            keep &= np.atleast_2d(valid)
+        x = np.where(keep, x, 0.0)
+        y = np.where(keep, y, 0.0)
+        self.rows += x.shape[0]
+        self.n += keep.sum(axis=0)
+        self.sx += x.sum(axis=0)
+        self.sy += y.sum(axis=0)
+        self.sxx += np.einsum('ij,ij->j', x, x)
+        self.syy += np.einsum('ij,ij->j', y, y)
+        self.sxy += np.einsum('ij,ij->j', x, y)
+        return self
+
+    def add(self, view_idx, x, y):
+        """Add score pairs (1-D x, y) of a single view, skipping pairs with a NaN or MISSING_SCORE entry."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        keep = _observed(x, y)
+        x, y = x[keep], y[keep]
+        self.n[view_idx] += x.size
+        self.sx[view_idx] += x.sum()
+        self.sy[view_idx] += y.sum()
+        self.sxx[view_idx] += x @ x
+        self.syy[view_idx] += y @ y
+        self.sxy[view_idx] += x @ y
+        return self
+
+    def merge(self, other):
+        """Add the sums of another accumulator (e.g. another shard) into this one."""
+        if other.num_views != self.num_views:
+            raise ValueError(f"Cannot merge accumulators of {other.num_views} and {self.num_views} views")
+        for field in SUM_FIELDS:
+            np.add(getattr(self, field), getattr(other, field), out=getattr(self, field))
+        self.rows += other.rows
+        return self
+
+    def _centered(self):
+        # Centered sums: Sxx = Σx² - (Σx)²/n, Syy likewise, Sxy = Σxy - ΣxΣy/n
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sxx = self.sxx - self.sx * self.sx / self.n
+            syy = self.syy - self.sy * self.sy / self.n
+            sxy = self.sxy - self.sx * self.sy / self.n
+        return np.maximum(sxx, 0.0), np.maximum(syy, 0.0), sxy
+
+    def pearson(self):
+        """Pearson r per view: r = Sxy / sqrt(Sxx * Syy)"""
+        sxx, syy, sxy = self._centered()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.clip(sxy / np.sqrt(sxx * syy), -1.0, 1.0)
+
+    def slope(self):
+        """Least-squares slope per view: Sxy / Sxx"""
+        sxx, syy, sxy = self._centered()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return sxy / sxx
+
+    def intercept(self):
+        """Least-squares intercept per view: ȳ - slope * x̄"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (self.sy - self.slope() * self.sx) / self.n
+
+    def r_squared(self):
+        """Coefficient of determination per view: R² = r²"""
+        return self.pearson() ** 2
+
+    def rmse(self):
+        """In-sample RMSE per view: sqrt(SSE / n) with SSE = Syy - slope * Sxy"""
+        sxx, syy, sxy = self._centered()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(np.maximum(syy - sxy / sxx * sxy, 0.0) / self.n)
+
+    def p_value(self):
+        """Two-sided p-value of r per view: t = r * sqrt((n - 2) / (1 - r²)) on n - 2 df"""
+        r = self.pearson()
+        df = self.n - 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = r * np.sqrt(df / ((1.0 - r) * (1.0 + r)))
+            p = 2 * stats.t.sf(np.abs(t), df)
+        return np.where(df > 0, p, np.nan)
+
+    def fit(self):
+        """All per-view results as a structured array of VIEW_FIT_DTYPE."""
+        fits = np.zeros(self.num_views, dtype=VIEW_FIT_DTYPE)
+        fits['view'] = np.arange(self.num_views)
+        fits['n'] = self.n
+        fits['r'] = self.pearson()
+        fits['p_value'] = self.p_value()
+        fits['slope'] = self.slope()
+        fits['intercept'] = self.intercept()
+        fits['rmse'] = self.rmse()
+        fits['r_squared'] = self.r_squared()
+        return fits
+
+    def save(self, path=STATS_PATH):
+        """Persist the sums, rows (and source_mtime_ns, if set) to an .npz file."""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        source = {} if self.source_mtime_ns is None else {'source_mtime_ns': np.int64(self.source_mtime_ns)}
+        np.savez(path, **{field: getattr(self, field) for field in SUM_FIELDS}, rows=np.int64(self.rows), **source)
+
+    @classmethod
+    def load(cls, path=STATS_PATH):
+        """Load sums saved with save()."""
+        with np.load(path) as data:
+            acc = cls(data['n'].size)
+            for field in SUM_FIELDS:
+                setattr(acc, field, data[field].astype(np.float64))
+            if 'rows' in data:
+                acc.rows = int(data['rows'])
+            if 'source_mtime_ns' in data:
+                acc.source_mtime_ns = int(data['source_mtime_ns'])
+        return acc
+
+
+def load_scores(path=STATS_PATH, dataset=default_dataset):
+    """
+    Persisted accumulator of a dataset's gen_impr / crit_perc scores, brought up to date:
+        score file unchanged since the last save -> loaded as is (the file is not read)
+        participant rows appended since then     -> only the new rows are added (update)
+        first run, or rows removed               -> rebuilt from all rows
+    Rows already ingested are assumed unchanged (new participants are appended).
+    The accumulator is saved again whenever rows were added.
+    """
+    mtime_ns = os.stat(dataset.path).st_mtime_ns
+    acc = ScoreAccumulator.load(path) if os.path.exists(path) else None
+    if acc is not None and acc.source_mtime_ns == mtime_ns:
+        return acc
+
+    gen_impr, crit_perc = dataset.load('gen_impr', 'crit_perc')
+    valid = dataset.validity()
+    if acc is None or acc.num_views != gen_impr.shape[1] or acc.rows > gen_impr.shape[0]:
+        acc = ScoreAccumulator(gen_impr.shape[1])
+    new = slice(acc.rows, None)
+    acc.update(gen_impr[new], crit_perc[new], valid[new])
+    acc.source_mtime_ns = mtime_ns
+    acc.save(path)
+    return acc
+
+
+def _observed(x, y):
+    """Mask of score pairs where neither score is NaN or the MISSING_SCORE sentinel."""
+    return ~np.isnan(x) & ~np.isnan(y) & (x != MISSING_SCORE) & (y != MISSING_SCORE)
+
+
+if __name__ == "__main__":
+    # Persisted statistics, with any participants added to cw2.mat since the last run ingested
+    acc = load_scores(STATS_PATH)
+
+    print(f"{'View':<10} {'n':<6} {'Pearson r':<12} {'Slope':<10} {'Intercept':<12} {'RMSE':<10} {'R²':<10}")
+    for fit in acc.fit():
+        print(f"{'View ' + str(fit['view'] + 1):<10} {fit['n']:<6} {fit['r']:<12.4f} {fit['slope']:<10.4f} "
+              f"{fit['intercept']:<12.4f} {fit['rmse']:<10.4f} {fit['r_squared']:<10.4f}")
@@ -0,0 +1,125 @@
+# Shared-memory dataset host for CW2 worker pools.
+# The host process packs the image tensor once (dataloader pack_images) straight
+# into multiprocessing.shared_memory blocks, so it holds no private copy besides
+# the shared one. Workers receive only small descriptors (block name, shape, dtype)
+# and attach zero-copy NumPy views, so a pool of any size holds one copy of the
+# dataset instead of re-running loadmat or unpickling image arrays per worker.
+#
+# Cleanup: blocks are unlinked by SharedDataset.close() / the with-block, and by a
+# weakref finalizer at interpreter exit (including exits through an unhandled
+# exception). If the host is killed outright, multiprocessing's resource tracker
+# unlinks the blocks it created.
+
+import weakref
+import numpy as np
+from multiprocessing import shared_memory
+from dataloader import dataset as default_dataset
+
+# Arrays shared by SharedDataset.from_dataset, in image_tensor() order
+TENSOR_KEYS = ('test', 'gold', 'valid', 'shapes')
+
+# Per-process cache of attached blocks: descriptor key -> (SharedMemory, ndarray)
+_ATTACHED = {}
+
+
+def _release(blocks):
+    """Close and unlink the host's shared memory blocks (safe to call more than once)."""
+    while blocks:
+        shm = blocks.pop()
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _open_block(name):
+    # Python 3.13+ can skip registering attached (not owned) blocks with the resource tracker
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedDataset:
+    """
+    Host side: owns one shared memory block per array.
+    descriptors: dict key -> (block name, shape, dtype string), cheap to pickle to workers.
+    """
+
+    def __init__(self, arrays=None):
+        self.descriptors = {}
+        self._blocks = []
+        # Registered before any block is created so a failure part-way still cleans up
+        self._finalizer = weakref.finalize(self, _release, self._blocks)
+        for key, array in (arrays or {}).items():
+            array = np.asarray(array)
+            self.allocate(key, array.shape, array.dtype)[...] = array
+
+    def allocate(self, key, shape, dtype):
+        """
+        Create the shared block of array key and return a writable view of it.
+        New blocks are zero-filled, so the array can be packed in place.
+        """
+        dtype = np.dtype(dtype)
+        shape = tuple(int(n) for n in shape)
+        shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        self._blocks.append(shm)
+        self.descriptors[key] = (shm.name, shape, dtype.str)
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def from_dataset(cls, dataset=default_dataset):
+        """
+        Share the packed image tensor (test, gold, valid, shapes) of a CW2Dataset,
+        packed directly into the shared blocks (the dataset's image_tensor cache is
+        neither used nor filled).
+        """
+        shared = cls()
+        try:
+            dataset.pack_images(shared.allocate)
+        except BaseException:
+            shared.close()
+            raise
+        return shared
+
+    @property
+    def nbytes(self):
+        return sum(shm.size for shm in self._blocks)
+
+    def close(self):
+        """Release the shared memory blocks. Workers must have detached (pool shut down) first."""
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(descriptors):
+    """
+    Worker side: zero-copy NumPy views of the shared arrays described by descriptors.
+    Blocks are attached once per process and kept open for the life of the worker.
+    Returns a dict key -> read-only ndarray.
+    """
+    arrays = {}
+    for key, (name, shape, dtype) in descriptors.items():
+        if key not in _ATTACHED or _ATTACHED[key][0].name != name:
+            shm = _open_block(name)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            array.flags.writeable = False
+            _ATTACHED[key] = (shm, array)
+        arrays[key] = _ATTACHED[key][1]
+    return arrays
+
+
+def init_worker(descriptors):
+    """ProcessPoolExecutor initializer: attach the shared arrays once in each worker."""
+    attach(descriptors)
+
+
+def worker_arrays():
+    """Arrays attached in this worker by init_worker / attach."""
+    return {key: array for key, (shm, array) in _ATTACHED.items()}
@@ -0,0 +1,354 @@
+# Similarity metric engines for CW2 Question 2.
+# The gold standard image is the same for every participant of a view, so all of
+# its per-image quantities are computed once per view (on first use) in a GoldTemplate:
+#   - flattened float64 pixels, their sum and sum of squares (intensity metrics)
+#   - integer pixel codes and their histogram                (mutual information)
+#   - SSIM local mean mu and sample variance sigma^2         (structural similarity)
+#   - min / max                                              (SSIM data_range)
+# The metric functions take a template and a stack of test images, so per-participant work
+# covers only the test image and the gold-test cross terms.
+
+import numpy as np
+from functools import cached_property
+from scipy.ndimage import uniform_filter
+
+# SSIM parameters, as skimage.metrics.structural_similarity defaults
+SSIM_WIN = 7
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+SSIM_COV_NORM = SSIM_WIN ** 2 / (SSIM_WIN ** 2 - 1)  # sample covariance
+SSIM_PAD = (SSIM_WIN - 1) // 2  # border excluded from the mean SSIM
+SSIM_BLOCK_BYTES = 1 << 20  # float64 block size per moment buffer in batched_ssim (cache-sized)
+MI_BATCH = 16  # max images per joint-histogram bincount in mutual_info_batch
+MI_CELLS = 1 << 22  # max joint-histogram cells per bincount (32 MB of int64 counts)
+# intensity_sums / batched_cosine tiles: 16 images x 8192 pixels = 1 MB of float64,
+# L2-sized, so the three passes over each tile (X g, row Σa², row Σa) read it from cache
+COS_TILE_ROWS = 16  # images per tile
+COS_TILE_PIXELS = 1 << 13  # pixels per tile
+PSNR_PEAK = 255.0  # peak intensity of the 8-bit images, for PSNR
+
+# Per-pair reductions of intensity_sums (a = test, b = gold)
+SUMS_DTYPE = np.dtype([('n', np.float64), ('sa', np.float64), ('sb', np.float64),
+                       ('saa', np.float64), ('sbb', np.float64), ('sab', np.float64)])
+INTENSITY_METRICS = ('cs', 'ncc', 'mse', 'psnr')
+
+
+class GoldTemplate:
+    """
+    Precomputed statistics of one view's gold standard image. Each statistic is
+    computed on first access and then cached, so only the metrics in use pay for it.
+    image / flat: (H, W) and flattened float64 pixels
+    sum, sq_sum:  sum(flat), sum(flat^2)
+    min, max:     pixel range
+    codes:        flattened integer pixel codes (as int(pixel)), code_min their offset
+    histogram:    counts of codes - code_min
+    mu, var:      SSIM local mean and sample variance over SSIM_WIN x SSIM_WIN windows
+    """
+
+    def __init__(self, gold):
+        self.image = np.squeeze(gold).astype(np.float64)
+        self.shape = self.image.shape
+        self.flat = self.image.ravel()
+        self.min = self.flat.min()
+        self.max = self.flat.max()
+
+    @cached_property
+    def sum(self):
+        return self.flat.sum()
+
+    @cached_property
+    def sq_sum(self):
+        return self.flat @ self.flat
+
+    @cached_property
+    def codes(self):
+        return self.flat.astype(np.int64)
+
+    @cached_property
+    def code_min(self):
+        return self.codes.min()
+
+    @cached_property
+    def histogram(self):
+        return np.bincount(self.codes - self.code_min)
+
+    @cached_property
+    def mu(self):
+        return uniform_filter(self.image, size=SSIM_WIN)
+
+    @cached_property
+    def var(self):
+        return SSIM_COV_NORM * (uniform_filter(self.image * self.image, size=SSIM_WIN) - self.mu * self.mu)
+
+    def data_range(self, test):
+        """SSIM data_range of a pair: max(gold, test) - min(gold, test)."""
+        return max(self.max, test.max()) - min(self.min, test.min())
+
+
+class TemplateCache:
+    """Gold templates built on first use per view from an indexable of gold images."""
+
+    def __init__(self, golds):
+        self.golds = golds
+        self._templates = {}
+
+    def __getitem__(self, view_idx):
+        if view_idx not in self._templates:
+            self._templates[view_idx] = GoldTemplate(self.golds[view_idx])
+        return self._templates[view_idx]
+
+
+def batched_ssim(template, tests, full=False, batch=None):
+    """
+    Mean SSIM of every image of an (N, H, W) stack of test images against one
+    view's gold template, matching structural_similarity per image (7x7 uniform
+    window, K1 = 0.01, K2 = 0.03, sample covariance, per-pair data_range from
+    template.data_range, SSIM_PAD border cropped).
+    The separable local-mean filters run over a whole block of images at once
+    (window 1 along the stack axis). Blocks of `batch` images (default: as many as
+    fit in SSIM_BLOCK_BYTES per float64 buffer) keep the moment buffers, which are
+    reused in place, cache-sized.
+
+    Returns:
+        mssim: (N,) mean SSIM per image
+        maps:  (N, H, W) SSIM maps, only if full=True
+    """
+    tests = np.asarray(tests)
+    n = tests.shape[0]
+    if batch is None:
+        batch = max(1, SSIM_BLOCK_BYTES // (template.image.size * 8))
+    mssim = np.empty(n, dtype=np.float64)
+    maps = np.empty(tests.shape, dtype=np.float64) if full else None
+    size = (1, SSIM_WIN, SSIM_WIN)
+    gold = template.image[None]
+    ux = template.mu[None]
+    two_ux = 2 * ux
+    ux_sq = ux ** 2
+
+    for b0 in range(0, n, batch):
+        y = tests[b0:b0 + batch].astype(np.float64)
+        # Per-pair data_range: max(gold, test) - min(gold, test)
+        R = (np.maximum(template.max, y.max(axis=(1, 2)))
+             - np.minimum(template.min, y.min(axis=(1, 2))))[:, None, None]
+        C1 = (SSIM_K1 * R) ** 2
+        C2 = (SSIM_K2 * R) ** 2
+
+        # Local moments of the block, with the same operation order as skimage
+        uy = uniform_filter(y, size=size)
+        uy_sq = uy * uy
+        vy = uniform_filter(y * y, size=size)
+        vy -= uy_sq
+        vy *= SSIM_COV_NORM
+        vxy = uniform_filter(np.multiply(gold, y, out=y), size=size)
+        vxy -= ux * uy
+        vxy *= SSIM_COV_NORM
+
+        # S = (A1 * A2) / (B1 * B2), built in place in the moment buffers
+        A1 = np.multiply(two_ux, uy, out=uy)
+        A1 += C1
+        A2 = np.multiply(2, vxy, out=vxy)
+        A2 += C2
+        B1 = np.add(ux_sq, uy_sq, out=uy_sq)
+        B1 += C1
+        B2 = np.add(template.var, vy, out=vy)
+        B2 += C2
+        S = np.multiply(A1, A2, out=A1)
+        S /= np.multiply(B1, B2, out=B1)
+
+        mssim[b0:b0 + batch] = S[:, SSIM_PAD:-SSIM_PAD, SSIM_PAD:-SSIM_PAD].mean(axis=(1, 2), dtype=np.float64)
+        if full:
+            maps[b0:b0 + batch] = S
+    return (mssim, maps) if full else mssim
+
+
+def mi_levels(template, tests, value_range=None):
+    """
+    Integer level range of each image of an (N, H, W) stack for mutual_info_batch,
+    as (N,) arrays lo, K: the levels lo .. lo + K - 1 cover the gold image and that
+    test image, or value_range = (lo, hi) if given (test levels outside it are
+    clipped into the end levels). Each image's range depends only on itself and the
+    gold, so its binned MI does not depend on the rest of the stack.
+    """
+    n_images = tests.shape[0]
+    if value_range is not None:
+        lo, hi = (int(level) for level in value_range)
+        return np.full(n_images, lo, dtype=np.int64), np.full(n_images, hi - lo + 1, dtype=np.int64)
+    gold_lo = int(template.code_min)
+    gold_hi = gold_lo + template.histogram.size - 1
+    flat = tests.reshape(n_images, -1)
+    lo = np.minimum(flat.min(axis=1).astype(np.int64), gold_lo)
+    hi = np.maximum(flat.max(axis=1).astype(np.int64), gold_hi)
+    return lo, hi - lo + 1
+
+
+def mutual_info_batch(template, tests, bins=None, batch=MI_BATCH, value_range=None):
+    """
+    Mutual information (nats) of every image of an (N, H, W) stack of integer-valued
+    test images against one view's gold template, equal (to floating-point
+    tolerance) to mutual_info_score(gold codes, test codes) per image.
+
+    Each pixel pair is encoded as gold * K + test over the K integer levels shared by
+    gold and test; one np.bincount over a block of images gives their (K x K) joint
+    histograms n_ij. With the gold marginal a_i taken from the template histogram,
+    the test marginal b_j and n pixels per image:
+        MI = sum_ij (n_ij / n) * ln(n * n_ij / (a_i * b_j))      (over n_ij > 0)
+    A block holds at most `batch` images and MI_CELLS histogram cells; when one
+    image's K x K histogram alone exceeds MI_CELLS (e.g. 16-bit images), only the
+    occupied cells are counted (np.unique of the pair codes), as sklearn does.
+    bins: optionally quantize each image's levels (see mi_levels) into this many
+          equal-width bins (level * bins // K) before counting, giving a bins x bins
+          joint histogram.
+    value_range: optional fixed (lo, hi) level range for the bins, e.g. the
+          acquisition range shared by a whole dataset.
+    """
+    tests = np.asarray(tests)
+    n_images = tests.shape[0]
+    pixels = template.codes.size
+    mi = np.zeros(n_images, dtype=np.float64)
+    if n_images == 0:
+        return mi
+
+    gold_levels = np.arange(template.code_min, template.code_min + template.histogram.size)
+    lo, K = mi_levels(template, tests, value_range)
+    if bins is None:
+        # Unbinned MI does not depend on the level offset: one range for the whole stack
+        K = np.full(n_images, (lo + K).max() - lo.min())
+        lo = np.full(n_images, lo.min())
+        num_bins = int(K[0])
+    else:
+        num_bins = bins
+    cells = num_bins * num_bins
+    dense = cells <= MI_CELLS
+    batch = max(1, min(batch, MI_CELLS // cells))
+
+    for b0 in range(0, n_images, batch):
+        block_lo = lo[b0:b0 + batch, None]
+        block_K = K[b0:b0 + batch, None]
+        n_block = block_lo.shape[0]
+        rows = np.arange(n_block)[:, None]
+        # Level indices of the test pixels, gold pixels and gold histogram levels of each image
+        test_idx = np.clip(tests[b0:b0 + batch].reshape(-1, pixels).astype(np.int64) - block_lo, 0, block_K - 1)
+        gold_idx = template.codes - block_lo
+        level_idx = gold_levels - block_lo
+        if bins is not None:
+            test_idx = test_idx * bins // block_K
+            gold_idx = gold_idx * bins // block_K
+            level_idx = level_idx * bins // block_K
+        gold_marginal = np.bincount((level_idx + rows * num_bins).ravel(),
+                                    weights=np.broadcast_to(template.histogram, level_idx.shape).ravel(),
+                                    minlength=n_block * num_bins).astype(np.int64).reshape(n_block, num_bins)
+        test_marginal = np.bincount((test_idx + rows * num_bins).ravel(),
+                                    minlength=n_block * num_bins).reshape(n_block, num_bins)
+
+        # Pair codes of all images of the block, offset per image
+        codes = (gold_idx * num_bins + test_idx + rows * cells).ravel()
+        if dense:
+            joint = np.bincount(codes, minlength=n_block * cells)
+            nz = np.flatnonzero(joint)
+            n_ij = joint[nz]
+        else:
+            nz, n_ij = np.unique(codes, return_counts=True)
+        image, cell = np.divmod(nz, cells)
+        outer = gold_marginal[image, cell // num_bins] * test_marginal[image, cell % num_bins]
+
+        p_ij = n_ij / pixels
+        terms = p_ij * (np.log(n_ij) - np.log(pixels)) + p_ij * (-np.log(outer) + 2 * np.log(pixels))
+        terms[np.abs(terms) < np.finfo(np.float64).eps] = 0.0
+        block_mi = np.bincount(image, weights=terms, minlength=n_block)
+        # Single-level gold or test image: zero entropy, so MI = 0 (as sklearn)
+        block_mi[(np.count_nonzero(gold_marginal, axis=1) == 1)
+                 | (np.count_nonzero(test_marginal, axis=1) == 1)] = 0.0
+        mi[b0:b0 + n_block] = np.clip(block_mi, 0.0, None)
+    return mi
+
+
+def mutual_info_with_template(template, test, bins=None, value_range=None):
+    """Mutual information (nats) of one test image against the gold template (see mutual_info_batch)."""
+    return mutual_info_batch(template, np.asarray(test)[None], bins=bins, value_range=value_range)[0]
+
+
+def intensity_sums(template, tests, dtype=np.float64, tile_rows=COS_TILE_ROWS, tile_pixels=COS_TILE_PIXELS):
+    """
+    Fused reductions of every image a of an (N, H, W) stack against the gold image b
+    of one view, in one tiled pass over the test pixels:
+        n, Σa, Σb, Σa², Σb², Σab
+    Σb and Σb² come from the template. X, the (N, H*W) matrix of flattened test
+    images (a reshaped view of the stack when each image is contiguous), is read in
+    (tile_rows x tile_pixels) tiles converted to `dtype`; per tile, Σab is one
+    matrix-vector product with the gold vector and Σa, Σa² are row reductions,
+    accumulated across tiles in float64. A memory-mapped stack larger than memory
+    streams from disk one tile at a time.
+    dtype: float64 (default) keeps the sums of 8-bit images exact, so the metrics
+           match the per-image float64 reference; float32 halves the tile
+           bandwidth at ~1e-7 relative error (opt-in, not for the report path).
+    Returns a structured array of SUMS_DTYPE, one record per image.
+    """
+    tests = np.asarray(tests)
+    n = tests.shape[0]
+    X = tests.reshape(n, -1)
+    gold = template.flat.astype(dtype, copy=False)
+    sums = np.zeros(n, dtype=SUMS_DTYPE)
+    sums['n'] = X.shape[1]
+    sums['sb'] = template.sum
+    sums['sbb'] = template.sq_sum
+    sa, saa, sab = (np.zeros(n, dtype=np.float64) for _ in range(3))
+    for r0 in range(0, n, tile_rows):
+        for c0 in range(0, X.shape[1], tile_pixels):
+            tile = X[r0:r0 + tile_rows, c0:c0 + tile_pixels].astype(dtype)
+            sab[r0:r0 + tile_rows] += tile @ gold[c0:c0 + tile_pixels]
+            saa[r0:r0 + tile_rows] += np.einsum('ij,ij->i', tile, tile)
+            sa[r0:r0 + tile_rows] += tile.sum(axis=1, dtype=np.float64)
+    sums['sa'], sums['saa'], sums['sab'] = sa, saa, sab
+    return sums
+
+
+def intensity_metrics(sums, metrics=INTENSITY_METRICS, peak=PSNR_PEAK):
+    """
+    Intensity-based similarity metrics from the reductions of intensity_sums:
+        CS   = Σab / (sqrt(Σa²) sqrt(Σb²))
+        NCC  = (Σab - Σa Σb / n) / sqrt((Σa² - (Σa)² / n)(Σb² - (Σb)² / n))
+        MSE  = (Σa² - 2 Σab + Σb²) / n
+        PSNR = 10 log10(peak² / MSE)   (dB; inf for identical images)
+    Returns a dict metric name -> (N,) array.
+    """
+    n, sa, sb, saa, sbb, sab = (sums[field] for field in SUMS_DTYPE.names)
+    out = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if 'cs' in metrics:
+            # As dot(a, b) / (||a|| * ||b||): the same rounding as the per-image reference
+            out['cs'] = sab / (np.sqrt(saa) * np.sqrt(sbb))
+        if 'ncc' in metrics:
+            out['ncc'] = (sab - sa * sb / n) / np.sqrt(np.maximum(saa - sa * sa / n, 0.0)
+                                                      * np.maximum(sbb - sb * sb / n, 0.0))
+        if 'mse' in metrics or 'psnr' in metrics:
+            mse = np.maximum(saa - 2 * sab + sbb, 0.0) / n
+            if 'mse' in metrics:
+                out['mse'] = mse
+            if 'psnr' in metrics:
+                out['psnr'] = 10 * np.log10(peak ** 2 / mse)
+    return out
+
+
+def batched_cosine(template, tests, dtype=np.float64, tile_rows=COS_TILE_ROWS, tile_pixels=COS_TILE_PIXELS):
+    """
+    Cosine similarity of every image of an (N, H, W) stack against one view's gold
+    template: CS_k = (X g)_k / (||X_k|| * ||g||), from the tiled reductions of
+    intensity_sums (one matrix-vector product and one norm einsum per tile).
+    """
+    return intensity_metrics(intensity_sums(template, tests, dtype, tile_rows, tile_pixels), ('cs',))['cs']
+
+
+if __name__ == "__main__":
+    from dataloader import dataset
+
+    # Consistency check: batched MI of each image equals its single-image MI,
+    # with and without bins (binned levels must not depend on the rest of the stack)
+    test_stack, gold_stack, valid, shapes = dataset.image_tensor()
+    for v, (h, w) in enumerate(shapes):
+        template = GoldTemplate(gold_stack[v, :h, :w])
+        tests = test_stack[np.flatnonzero(valid[:, v]), v, :h, :w]
+        for bins in (None, 16, 64):
+            batched = mutual_info_batch(template, tests, bins=bins)
+            single = np.array([mutual_info_with_template(template, test, bins=bins) for test in tests])
+            assert np.array_equal(batched, single), f"View {v + 1}, bins={bins}: batched MI != single-image MI"
+    print("Batched and single-image MI agree for all views (bins = None, 16, 64)")